@@ -0,0 +1,209 @@
+"""
+Benchmarks of gitlab_calls and of the FastAPI endpoints against an in-process
+fake GitLab (fake_gitlab.py): no network, no GitLab instance, reproducible.
+
+For every scenario reports throughput, p50/p99 latency, peak traced memory
+(tracemalloc, measured in a separate run so it doesn't skew timings) and the
+upstream requests it cost.
+
+Run from the repository root:
+  PYTHONPATH=src python benchmarks/bench.py
+  PYTHONPATH=src python benchmarks/bench.py --items 50000 --latency 0.005 --no-totals
+  PYTHONPATH=src python benchmarks/bench.py --scenario get_items_keyset --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Results of identical /get-items queries are not reused between benchmark runs
+os.environ.setdefault('ITEMS_RESULT_TTL', '0')
+os.environ.setdefault('GITLAB_STORE_PATH', '')
+# Per-request access logs of the app would be timed with the endpoint runs
+os.environ.setdefault('GITLAB_CALLS_LOG_LEVEL', 'WARNING')
+
+import httpx
+
+import gitlab_calls
+from fake_gitlab import FakeGitLab, generate_items
+
+
+def library_scenarios(args) -> dict:
+    """
+    name -> (coroutine function running one operation, items or grants it handles)
+    """
+    year = args.year
+    grants = [
+        {'username': f'user{n % 200}', 'repo_or_group': f'group/project{n % 50}', 'role': 'developer'}
+        for n in range(args.grants)
+    ]
+    return {
+        'get_items_offset': (lambda: gitlab_calls.get_items_by_year_async('mr', year, pagination='offset'),
+                             args.items),
+        'get_items_keyset': (lambda: gitlab_calls.get_items_by_year_async('mr', year, pagination='keyset'),
+                             args.items),
+        'get_items_shard_month': (lambda: gitlab_calls.get_items_by_year_async('mr', year, shard='month'),
+                                  args.items),
+        'get_items_shard_auto': (lambda: gitlab_calls.get_items_by_year_async('mr', year, shard='auto'),
+                                 args.items),
+        'get_items_projected': (lambda: gitlab_calls.get_items_by_year_async(
+            'mr', year, fields=['id', 'title', 'state', 'author.username']), args.items),
+        'iter_items': (lambda: _drain(gitlab_calls.iter_items_by_year_async('mr', year)), args.items),
+        'count_items': (lambda: gitlab_calls.count_items_by_year_async('mr', year), 1),
+        'aggregate_items': (lambda: gitlab_calls.aggregate_items_by_year_async(
+            'mr', year, group_by=['month', 'state']), args.items),
+        'grant_user_role': (lambda: gitlab_calls.grant_user_role_async('user1', 'group/project1', 'developer'), 1),
+        'grant_user_roles': (lambda: gitlab_calls.grant_user_roles_async(grants), len(grants)),
+    }
+
+
+def endpoint_scenarios(args) -> dict:
+    """
+    name -> (method, path, JSON body) of the API requests issued by `clients` concurrent clients
+    """
+    return {
+        'api_get_items': ('POST', '/get-items', {'item_type': 'mr', 'year': args.year}),
+        'api_get_items_stream': ('POST', '/get-items', {'item_type': 'mr', 'year': args.year, 'stream': True}),
+        'api_count_items': ('POST', '/get-items', {'item_type': 'mr', 'year': args.year, 'count_only': True}),
+        'api_grant_role': ('POST', '/grant-role',
+                           {'username': 'user1', 'repo_or_group': 'group/project1', 'role': 'developer'}),
+    }
+
+
+async def _drain(items) -> None:
+    async for _ in items:
+        pass
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def _reset(fake: FakeGitLab) -> None:
+    """
+    Fresh client, caches and counters, so every run starts cold.
+    """
+    gitlab_calls.set_transport(httpx.ASGITransport(app=fake))
+    gitlab_calls.invalidate_resolver_cache()
+    fake.reset_counters()
+
+
+def measure(fake: FakeGitLab, run, repeat: int, units: int) -> dict:
+    """
+    Time `repeat` runs of `run()` (a coroutine function returning the latencies
+    of the operations it made), then trace the memory of one more.
+    """
+    latencies = []
+    elapsed = 0.0
+    requests = 0
+    for _ in range(repeat):
+        _reset(fake)
+        started = time.perf_counter()
+        latencies += asyncio.run(run())
+        elapsed += time.perf_counter() - started
+        requests += fake.requests
+
+    _reset(fake)
+    tracemalloc.start()
+    asyncio.run(run())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'operations': len(latencies),
+        'throughput': round(units * len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'peak_mib': round(peak / 2 ** 20, 2),
+        'upstream_requests': requests // repeat,
+        'throttled': fake.throttled,
+    }
+
+
+def library_run(fn):
+    async def run():
+        started = time.perf_counter()
+        await fn()
+        latency = time.perf_counter() - started
+        await gitlab_calls.aclose_client()
+        return [latency]
+    return run
+
+
+def endpoint_run(method: str, path: str, body: dict, clients: int, requests_per_client: int):
+    async def run():
+        import app  # imported late: picks up the environment set above
+
+        latencies = []
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            async def worker():
+                for _ in range(requests_per_client):
+                    started = time.perf_counter()
+                    response = await client.request(method, path, json=body)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(worker() for _ in range(clients)))
+        await gitlab_calls.aclose_client()
+        return latencies
+    return run
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=20000, help='items of the fake year')
+    parser.add_argument('--year', type=int, default=2024)
+    parser.add_argument('--per-page', type=int, default=100, help='max page size served by the fake GitLab')
+    parser.add_argument('--latency', type=float, default=0.002, help='fake GitLab response delay, seconds')
+    parser.add_argument('--no-totals', action='store_true', help='omit x-total / x-total-pages')
+    parser.add_argument('--no-keyset', action='store_true', help='ignore pagination=keyset')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests allowed per rate window')
+    parser.add_argument('--rate-window', type=float, default=1.0, help='rate window, seconds')
+    parser.add_argument('--grants', type=int, default=500, help='grants of the batch grant scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients of the endpoint scenarios')
+    parser.add_argument('--client-requests', type=int, default=5, help='requests per endpoint client')
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    # retries back off quickly against the fake server
+    gitlab_calls.gitlab_calls.GITLAB_BACKOFF_BASE = 0.01
+    gitlab_calls.set_default_store(None)
+
+    fake = FakeGitLab(generate_items(args.items, args.year), latency=args.latency,
+                      totals=not args.no_totals, keyset=not args.no_keyset, max_per_page=args.per_page,
+                      rate_limit=args.rate_limit, rate_window=args.rate_window)
+
+    runs = {name: (library_run(fn), units) for name, (fn, units) in library_scenarios(args).items()}
+    runs.update({
+        name: (endpoint_run(method, path, body, args.clients, args.client_requests), 1)
+        for name, (method, path, body) in endpoint_scenarios(args).items()
+    })
+    unknown = set(args.scenario or ()) - set(runs)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}; available: {', '.join(runs)}")
+
+    results = {}
+    print(f"{'scenario':24} {'ops':>5} {'units/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'peak MiB':>9} {'upstream':>9}")
+    for name, (run, units) in runs.items():
+        if args.scenario and name not in args.scenario:
+            continue
+        result = results[name] = measure(fake, run, args.repeat, units)
+        print(f"{name:24} {result['operations']:>5} {result['throughput']:>11} {result['p50_ms']:>9} "
+              f"{result['p99_ms']:>9} {result['peak_mib']:>9} {result['upstream_requests']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump({'config': vars(args), 'results': results}, out, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+In-process fake of the GitLab REST API used by the benchmarks, as an ASGI app
+to plug into gitlab_calls.set_transport(httpx.ASGITransport(app)).
+
+Serves:
+  - GET /merge_requests, /issues: `items` generated items spread over `year`,
+    filtered by created_after/created_before/updated_after, newest first, with
+    offset pagination (x-page, x-next-page and, up to `totals_cap` rows,
+    x-total / x-total-pages) and keyset pagination (Link rel="next")
+  - GET /users?username=, /projects/:id, /groups/:id and member PUT/POST
+Page sizes are capped at `max_per_page`. Every response is delayed by `latency` seconds; with `rate_limit` set, requests
+beyond that budget per `rate_window` get 429 with Retry-After, and every
+response carries RateLimit-* headers.
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, unquote, urlencode
+
+STATES = ('merged', 'opened', 'closed')
+
+
+def generate_items(count: int, year: int, projects: int = 50, authors: int = 200,
+                   description_bytes: int = 200) -> list[dict]:
+    """
+    `count` deterministic items created evenly over `year`, oldest first; ids
+    grow with creation time.
+    """
+    start = datetime(year, 1, 1)
+    step = timedelta(days=365) / max(count, 1)
+    items = []
+    for n in range(count):
+        created = start + step * n
+        state = STATES[n % len(STATES)]
+        done = (created + timedelta(hours=1 + n % 300)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        items.append({
+            'id': n + 1,
+            'iid': n // projects + 1,
+            'project_id': n % projects + 1,
+            'title': f'Item {n + 1}',
+            'description': 'x' * description_bytes,
+            'state': state,
+            'author': {'id': n % authors + 1, 'username': f'user{n % authors + 1}'},
+            'assignees': [{'id': (n + 7) % authors + 1, 'username': f'user{(n + 7) % authors + 1}'}],
+            'labels': ['bug' if n % 2 else 'feature'],
+            'created_at': created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'updated_at': done if state != 'opened' else created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'merged_at': done if state == 'merged' else None,
+            'closed_at': done if state == 'closed' else None,
+        })
+    return items
+
+
+class FakeGitLab:
+    """
+    ASGI app answering the GitLab API calls made by gitlab_calls.
+    """
+
+    def __init__(self, items: list[dict], latency: float = 0.0, totals: bool = True,
+                 totals_cap: int = 10000, keyset: bool = True, max_per_page: int = 100,
+                 rate_limit: int | None = None, rate_window: float = 1.0):
+        self.latency = latency
+        self.totals = totals
+        self.totals_cap = totals_cap
+        self.keyset = keyset
+        self.max_per_page = max_per_page
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+
+        # ascending by created_at, compared to the second (the filters are
+        # inclusive); bodies pre-encoded so serving costs little CPU
+        self._created = [item['created_at'][:19] for item in items]
+        self._updated = [item['updated_at'][:19] for item in items]
+        self._encoded = [json.dumps(item).encode() for item in items]
+        self._members = set()
+
+        self.requests = 0
+        self.throttled = 0
+        self.bytes = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def reset_counters(self) -> None:
+        self.requests = self.throttled = self.bytes = 0
+
+    def _rate_headers(self) -> tuple[bool, list[tuple[bytes, bytes]]]:
+        """
+        (allowed, RateLimit-* headers) of the current request.
+        """
+        if self.rate_limit is None:
+            return True, []
+        now = time.monotonic()
+        if now - self._window_start >= self.rate_window:
+            self._window_start, self._window_count = now, 0
+        self._window_count += 1
+        reset_in = self._window_start + self.rate_window - now
+        headers = [
+            (b'ratelimit-limit', str(self.rate_limit).encode()),
+            (b'ratelimit-remaining', str(max(self.rate_limit - self._window_count, 0)).encode()),
+            (b'ratelimit-reset', str(int(time.time() + reset_in + 1)).encode()),
+        ]
+        if self._window_count > self.rate_limit:
+            return False, headers + [(b'retry-after', f'{reset_in:.3f}'.encode())]
+        return True, headers
+
+    def _listing(self, path: str, params: dict) -> tuple[int, list, bytes]:
+        low = bisect_left(self._created, params.get('created_after', '')[:19])
+        high = bisect_right(self._created, params.get('created_before', '~')[:19])
+        keyset = self.keyset and params.get('pagination') == 'keyset'
+        if keyset and 'cursor' in params:
+            # ids grow with creation time: the cursor is the last index served
+            high = min(high, int(params['cursor']))
+        indices = range(high - 1, low - 1, -1)  # newest first
+        if 'updated_after' in params:
+            indices = [i for i in indices if self._updated[i] >= params['updated_after'][:19]]
+        per_page = min(int(params.get('per_page', 20)), self.max_per_page)
+        headers = []
+
+        if keyset:
+            page = indices[:per_page]
+            if len(indices) > per_page:
+                next_params = urlencode({**params, 'cursor': page[-1]})
+                headers.append((b'link', f'<http://fake{path}?{next_params}>; rel="next"'.encode()))
+        else:
+            number = int(params.get('page', 1))
+            total = len(indices)
+            page = indices[(number - 1) * per_page:number * per_page]
+            headers.append((b'x-page', str(number).encode()))
+            headers.append((b'x-next-page', str(number + 1).encode() if number * per_page < total else b''))
+            if self.totals and total <= self.totals_cap:
+                headers.append((b'x-total', str(total).encode()))
+                headers.append((b'x-total-pages', str(max(-(-total // per_page), 1)).encode()))
+
+        body = b'[' + b','.join(self._encoded[i] for i in page) + b']'
+        return 200, headers, body
+
+    def _route(self, method: str, path: str, params: dict) -> tuple[int, list, bytes]:
+        parts = path.split('/api/v4/', 1)[-1].split('/')
+        match method, parts:
+            case 'GET', ['merge_requests' | 'issues']:
+                return self._listing(path, params)
+            case 'GET', ['users']:
+                username = params.get('username', '')
+                user = {'id': zlib.crc32(username.encode()) % 10 ** 6, 'username': username}
+                return 200, [], json.dumps([user]).encode()
+            case 'GET', ['projects' | 'groups', target]:
+                return 200, [], json.dumps({'id': zlib.crc32(unquote(target).encode()) % 10 ** 6}).encode()
+            case 'PUT', ['projects' | 'groups', target, 'members', user]:
+                if (target, user) not in self._members:
+                    return 404, [], b'{"message":"404 Not found"}'
+                return 200, [], b'{}'
+            case 'POST', ['projects' | 'groups', target, 'members']:
+                return 201, [], b'{}'
+        return 404, [], b'{"message":"404 Not found"}'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        allowed, headers = self._rate_headers()
+        if not allowed:
+            self.throttled += 1
+            status, extra, content = 429, [], b'{"message":"429 Too Many Requests"}'
+        else:
+            params = dict(parse_qsl(scope['query_string'].decode()))
+            path = scope.get('raw_path', scope['path'].encode()).decode().split('?', 1)[0]
+            status, extra, content = self._route(scope['method'], path, params)
+            if scope['method'] == 'POST' and status == 201:
+                target = path.split('/api/v4/', 1)[-1].split('/')[1]
+                self._members.add((target, str(json.loads(body or b'{}').get('user_id'))))
+
+        self.bytes += len(content)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(content)).encode())] + headers + extra
+        })
+        await send({'type': 'http.response.body', 'body': content})
@@ -6,19 +6,61 @@ Run
   uv run --env-file=.env app.py
 """
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import json
 import os
 from datetime import datetime
 import requests 
 import gitlab_calls
+from fast_responses import CompressionMiddleware, FastJSONResponse, dumps
+from instrumentation import MetricsMiddleware, configure_logging, metrics_response
+
+
+# Items per chunk of a streamed /get-items response
+NDJSON_CHUNK_LINES = 200
+
+# Concurrent identical /get-items queries share one crawl; results are kept a few seconds,
+# up to ITEMS_RESULT_MAX_ITEMS items in total
+ITEMS_RESULT_TTL = float(os.getenv('ITEMS_RESULT_TTL', '10'))
+ITEMS_RESULT_MAX_ITEMS = int(os.getenv('ITEMS_RESULT_MAX_ITEMS', '200000'))
+items_flight = gitlab_calls.SingleFlight(ttl=ITEMS_RESULT_TTL, max_weight=ITEMS_RESULT_MAX_ITEMS)
+
+# Long /get-items crawls run as background jobs (JOB_WORKERS at a time)
+items_jobs = gitlab_calls.JobManager()
+
+# Most requested (item_type, year) queries are kept warm in the item store (PREFETCH_INTERVAL > 0)
+items_prefetch = gitlab_calls.Prefetcher()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    '''
+      Starts the prefetch of hot item queries; stops it and the background jobs and
+      releases the pooled GitLab client connections on shutdown
+    '''
+    items_prefetch.start()
+    yield
+    await items_prefetch.close()
+    await items_jobs.close()
+    await gitlab_calls.aclose_client()
 
 
 app = FastAPI(
     title="GitLab API Service",
     description="Service for managing GitLab user permissions and querying issues/merge requests",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# gzip / zstd negotiated from Accept-Encoding; small responses are left as they are
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+# Route latency / status metrics and per-request GitLab cost log lines
+app.add_middleware(MetricsMiddleware)
+configure_logging()
+
 
 
 @app.get("/")
@@ -52,7 +94,7 @@ async def grant_role(request: Request):
         repo_or_group = body.get('repo_or_group')
         role = body.get('role')
         
-        result = gitlab_calls.grant_user_role(
+        result = await gitlab_calls.grant_user_role_async(
             username=username,
             repo_or_group=repo_or_group,
             role=role
@@ -69,6 +111,149 @@ async def grant_role(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/grant-roles")
+async def grant_roles(request: Request):
+    """
+    Grant or change roles for a batch of (user, repository or group) pairs.
+    Each distinct user and repository/group is looked up once; one failed grant
+    doesn't fail the batch.
+    
+    Expected JSON body:
+    {
+        "grants": [
+            {"username": "john.doe", "repo_or_group": "mygroup/myproject", "role": "developer"},
+            {"username": "jane.doe", "repo_or_group": "mygroup", "role": "reporter"}
+        ],
+        "concurrency": 10       # optional
+    }
+    """
+    try:
+        body = await request.json()
+        
+        grants = body.get('grants')
+        if not isinstance(grants, list) or not all(isinstance(grant, dict) for grant in grants):
+            raise ValueError("'grants' must be a list of objects")
+        
+        results = await gitlab_calls.grant_user_roles_async(
+            grants=grants,
+            concurrency=body.get('concurrency')
+        )
+        
+        failed = sum(not result['success'] for result in results)
+        return {
+            "success": failed == 0,
+            "total": len(results),
+            "failed": failed,
+            "results": results
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/grant-group-projects")
+async def grant_group_projects(request: Request):
+    """
+    Grant or change a user's role on every project of a group and its subgroups.
+    With "stream": true the per-project results are sent as NDJSON lines (with
+    done / total progress) as the writes complete.
+    
+    Expected JSON body:
+    {
+        "username": "john.doe",
+        "group": "mygroup",
+        "role": "reporter",
+        "include_subgroups": true,  # optional
+        "concurrency": 10,          # optional
+        "stream": false             # optional
+    }
+    """
+    try:
+        body = await request.json()
+        
+        options = dict(
+            username=body.get('username'),
+            group=body.get('group'),
+            role=body.get('role'),
+            include_subgroups=body.get('include_subgroups', True),
+            concurrency=body.get('concurrency')
+        )
+        if not options['username'] or not options['group']:
+            raise ValueError("username and group are required")
+        
+        if body.get('stream'):
+            results = gitlab_calls.iter_group_project_grants_async(**options)
+            first = await anext(results, None)
+            return StreamingResponse(ndjson_lines(first, results), media_type="application/x-ndjson")
+        
+        result = await gitlab_calls.grant_group_projects_async(**options)
+        return {"success": result['failed'] == 0, **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/reconcile-members")
+async def reconcile_members(request: Request):
+    """
+    Bring memberships in line with a manifest: current members of each project
+    or group are listed once and only missing memberships and role changes are
+    written (nothing is removed).
+    
+    Expected JSON body:
+    {
+        "manifest": [
+            {"username": "john.doe", "repo_or_group": "mygroup/myproject", "role": "developer"},
+            {"username": "jane.doe", "repo_or_group": "mygroup", "role": "reporter"}
+        ],
+        "dry_run": false,       # optional: only report the changes
+        "concurrency": 10       # optional
+    }
+    """
+    try:
+        body = await request.json()
+        
+        manifest = body.get('manifest')
+        if not isinstance(manifest, list) or not all(isinstance(entry, dict) for entry in manifest):
+            raise ValueError("'manifest' must be a list of objects")
+        
+        result = await gitlab_calls.reconcile_memberships_async(
+            manifest=manifest,
+            dry_run=bool(body.get('dry_run')),
+            concurrency=body.get('concurrency')
+        )
+        
+        return {"success": result['failed'] == 0, **result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def ndjson_lines(first: dict | None, items):
+    '''
+      Encodes items as newline-delimited JSON, a few hundred lines per chunk.
+      An upstream failure after the first byte is reported as a final {"error": ...} line
+    '''
+    if first is None:
+        return
+    lines = [dumps(first)]
+    try:
+        async for item in items:
+            lines.append(dumps(item))
+            if len(lines) >= NDJSON_CHUNK_LINES:
+                yield b'\n'.join(lines) + b'\n'
+                lines.clear()
+    except Exception as e:
+        lines.append(dumps({"error": str(e)}))
+    finally:
+        await items.aclose()
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
+
+
 @app.post("/get-items")
 async def get_items(request: Request):
     """
@@ -77,7 +262,14 @@ async def get_items(request: Request):
     Expected JSON body:
     {
         "item_type": "mr",
-        "year": 2023
+        "year": 2023,
+        "shard": "month",       # optional: month | week | auto
+        "pagination": "auto",   # optional: auto | offset | keyset
+        "fields": ["id", "title", "author.username"],   # optional: keep only these (dotted) fields
+        "stream": false,        # optional: stream items as NDJSON while they are fetched
+        "count_only": false,    # optional: only return the count (from GitLab's X-Total, no download)
+        "limit": 100,           # optional: return one page of `limit` items and a next_cursor
+        "cursor": "..."         # optional: next_cursor of the previous page
     }
     """
     try:
@@ -85,26 +277,337 @@ async def get_items(request: Request):
         
         item_type = body.get('item_type')
         year = body.get('year')
+        shard = body.get('shard')
+        pagination = body.get('pagination', 'auto')
+        fields = body.get('fields')
+        items_prefetch.record(item_type, year)
+
+        if body.get('count_only'):
+            query = json.dumps(['count', item_type, year], default=str)
+            count = await items_flight.do(query, lambda: gitlab_calls.count_items_by_year_async(
+                item_type=item_type,
+                year=year
+            ))
+            return {"success": True, "count": count}
+
+        if body.get('limit') is not None or body.get('cursor'):
+            page = await gitlab_calls.get_items_page_async(
+                item_type=item_type,
+                year=year,
+                limit=body.get('limit', 100),
+                cursor=body.get('cursor'),
+                fields=fields
+            )
+            return FastJSONResponse({
+                "success": True,
+                "count": len(page['items']),
+                "items": page['items'],
+                "next_cursor": page['next_cursor']
+            })
+
+        if body.get('stream'):
+            items = gitlab_calls.iter_items_by_year_async(
+                item_type=item_type,
+                year=year,
+                shard=shard,
+                pagination=pagination,
+                fields=fields
+            )
+            # Invalid arguments and a failing first page still get a proper error status
+            first = await anext(items, None)
+            return StreamingResponse(ndjson_lines(first, items), media_type="application/x-ndjson")
         
-        items = gitlab_calls.get_items_by_year(
+        # Identical concurrent queries await the same upstream crawl
+        query = json.dumps([item_type, year, shard, pagination, fields], default=str)
+        items = await items_flight.do(query, lambda: gitlab_calls.get_items_by_year_async(
             item_type=item_type,
-            year=year
+            year=year,
+            shard=shard,
+            pagination=pagination,
+            fields=fields
+        ))
+        
+        return FastJSONResponse({
+            "success": True,
+            "count": len(items),
+            "items": items
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search-items")
+async def search_items(request: Request):
+    """
+    Search the merge requests or issues held in the item store (indexed, no crawl
+    once a year is loaded). Filters are combined with AND; all are optional.
+    
+    Expected JSON body:
+    {
+        "item_type": "mr",
+        "year": 2023,               # optional: load / delta-sync this year first; omit to search all held items
+        "author": "john.doe",       # optional: author username
+        "assignee": "jane.doe",     # optional: assignee username
+        "labels": ["bug", "ui"],    # optional: items having all of them
+        "state": "opened",          # optional
+        "project_id": 42,           # optional
+        "milestone": "v1.0",        # optional: milestone title
+        "sort": "created_at",       # optional: created_at | updated_at
+        "order": "desc",            # optional: desc | asc
+        "limit": 100,               # optional: 1..1000
+        "fields": ["id", "title"]   # optional: keep only these (dotted) fields
+    }
+    """
+    try:
+        body = await request.json()
+        
+        filters = {name: body.get(name) for name in gitlab_calls.search.FILTERS}
+        items = await gitlab_calls.search_items_async(
+            item_type=body.get('item_type'),
+            year=body.get('year'),
+            sort=body.get('sort', 'created_at'),
+            order=body.get('order', 'desc'),
+            limit=body.get('limit', 100),
+            fields=body.get('fields'),
+            **filters
         )
         
-        return {
+        return FastJSONResponse({
             "success": True,
             "count": len(items),
             "items": items
-        }
+        })
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/export-items")
+async def export_items(request: Request):
+    """
+    Export the merge requests or issues created in a given year as flat typed
+    columns, streamed in batches while they are fetched.
+    
+    Expected JSON body:
+    {
+        "item_type": "mr",
+        "year": 2023,
+        "format": "parquet",    # csv | arrow | parquet (arrow / parquet need pyarrow)
+        "shard": "month",       # optional: month | week | auto
+        "pagination": "auto"    # optional: auto | offset | keyset
+    }
+    """
+    try:
+        body = await request.json()
+        
+        item_type = body.get('item_type')
+        year = body.get('year')
+        format = body.get('format', 'csv')
+        chunks = gitlab_calls.iter_export_async(
+            item_type=item_type,
+            year=year,
+            format=format,
+            shard=body.get('shard'),
+            pagination=body.get('pagination', 'auto')
+        )
+        # Invalid arguments and a failing first page still get a proper error status
+        first = await anext(chunks)
+        
+        async def export_chunks():
+            yield first
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+        
+        extension = {'csv': 'csv', 'arrow': 'arrows', 'parquet': 'parquet'}[format]
+        return StreamingResponse(
+            export_chunks(),
+            media_type=gitlab_calls.export.FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{item_type}-{year}.{extension}"'}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs")
+async def submit_job(request: Request):
+    """
+    Submit a /get-items crawl as a background job; returns its id at once.
+    An identical job already pending or running is returned instead of a new one.
+    
+    Expected JSON body:
+    {
+        "item_type": "mr",
+        "year": 2023,
+        "shard": "month",       # optional: month | week | auto
+        "pagination": "auto",   # optional: auto | offset | keyset
+        "fields": ["id", "title"]   # optional
+    }
+    """
+    try:
+        body = await request.json()
+        
+        job = items_jobs.submit(
+            item_type=body.get('item_type'),
+            year=body.get('year'),
+            shard=body.get('shard'),
+            pagination=body.get('pagination', 'auto'),
+            fields=body.get('fields')
+        )
+        
+        return FastJSONResponse({"success": True, **job.progress()}, status_code=202)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def find_job(job_id: str):
+    try:
+        return items_jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No job '{job_id}'")
+
+
+@app.get("/jobs/{job_id}")
+async def job_progress(job_id: str):
+    '''
+      State and progress (pages, items, windows done) of a job
+    '''
+    return {"success": True, **find_job(job_id).progress()}
+
+
+@app.get("/jobs/{job_id}/items")
+async def job_items(job_id: str, offset: int = 0, stream: bool = False):
+    '''
+      Items of a job from `offset` on: those fetched so far, or with stream=true
+      an NDJSON stream following the job until it finishes
+    '''
+    job = find_job(job_id)
+    try:
+        if stream:
+            items = job.follow(offset)
+            first = await anext(items, None)
+            return StreamingResponse(ndjson_lines(first, items), media_type="application/x-ndjson")
+        
+        items = job.items[offset:]
+        return FastJSONResponse({
+            "success": True,
+            "state": job.state,
+            "count": len(items),
+            "items": items
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    '''
+      Re-queue a failed or cancelled job; it continues with the windows it didn't complete
+    '''
+    find_job(job_id)
+    try:
+        return {"success": True, **items_jobs.resume(job_id).progress()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    find_job(job_id)
+    return {"success": True, **items_jobs.cancel(job_id).progress()}
+
+
+@app.post("/get-item-stats")
+async def get_item_stats(request: Request):
+    """
+    Grouped counts and time-to-merge / time-to-close percentiles (in seconds) of
+    the merge requests or issues created in a given year, computed server-side in
+    one streaming pass.
+    
+    Expected JSON body:
+    {
+        "item_type": "mr",
+        "year": 2023,
+        "group_by": ["month", "state"],     # optional: any of month | state | author | project
+        "percentiles": [50, 90, 99],        # optional
+        "shard": "month",                   # optional: month | week | auto
+        "pagination": "auto"                # optional: auto | offset | keyset
+    }
+    """
+    try:
+        body = await request.json()
+        
+        stats = await gitlab_calls.aggregate_items_by_year_async(
+            item_type=body.get('item_type'),
+            year=body.get('year'),
+            group_by=body.get('group_by', ['month']),
+            percentiles=body.get('percentiles', [50, 90, 99]),
+            shard=body.get('shard'),
+            pagination=body.get('pagination', 'auto')
+        )
+        
+        return FastJSONResponse({"success": True, **stats})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/webhooks/gitlab")
+async def gitlab_webhook(request: Request):
+    '''
+      Receives GitLab merge request / issue webhooks (secret token in X-Gitlab-Token,
+      GITLAB_WEBHOOK_SECRET) and upserts their item into the item store, so item
+      queries stay current without re-crawling GitLab
+    '''
+    if not gitlab_calls.webhooks.GITLAB_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhooks are disabled (set GITLAB_WEBHOOK_SECRET)")
+    if gitlab_calls.get_default_store() is None:
+        raise HTTPException(status_code=503, detail="Webhooks need an item store (set GITLAB_STORE_PATH)")
+    if not gitlab_calls.verify_token(request.headers.get('x-gitlab-token')):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    try:
+        payload = await request.json()
+        if not isinstance(payload, dict):
+            raise ValueError("webhook payload must be an object")
+        
+        event = request.headers.get('x-gitlab-event', '')
+        stored = await asyncio.to_thread(gitlab_calls.ingest_event, event, payload)
+        if stored is None:
+            return {"success": True, "ignored": event}
+        
+        item_type, item = stored
+        return {"success": True, "item_type": item_type, "id": item['id']}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/prefetch")
+async def prefetch_status():
+    '''
+      Prefetch state: hot (item_type, year) queries with their decayed request counts, last round
+    '''
+    return {"success": True, **items_prefetch.stats()}
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    '''
+      Prometheus metrics: GitLab request latency / status / bytes per endpoint, retries, route latency
+    '''
+    return metrics_response()
+
 def main():
     '''
     Bogus entrypoint - for debug
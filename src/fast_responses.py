@@ -0,0 +1,168 @@
+"""
+Fast response path for the item endpoints:
+  - JSON encoded with orjson when installed (stdlib json otherwise)
+  - gzip / zstd response compression negotiated from Accept-Encoding,
+    including streamed (NDJSON) responses
+"""
+
+import json
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+def dumps(content) -> bytes:
+    """
+    Encode content as compact UTF-8 JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered with dumps(). Return it directly from a handler to skip
+    FastAPI's jsonable_encoder pass over large item lists.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    Preferred supported content coding of an Accept-Encoding header: zstd (when
+    zstandard is installed) over gzip; None for identity.
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for coding in ('zstd', 'gzip'):
+        if coding == 'zstd' and zstandard is None:
+            continue
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+
+# Media types worth compressing; others (parquet, arrow streams, images) are already compact
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def compressible(content_type: str) -> bool:
+    """
+    Whether a Content-Type header is a text-like media type of COMPRESSIBLE_TYPES.
+    """
+    media_type = content_type.partition(';')[0].strip().lower()
+    return any(media_type == allowed or allowed.endswith('/') and media_type.startswith(allowed)
+               for allowed in COMPRESSIBLE_TYPES)
+
+
+class _Compressor:
+    """
+    Incremental compressor; flush() emits everything compressed so far so
+    streamed chunks reach the client without waiting for the end of the body.
+    """
+
+    def __init__(self, coding: str, gzip_level: int, zstd_level: int):
+        if coding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+            self._sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._sync = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.compress(data)
+        return out + (self._obj.flush() if final else self._obj.flush(self._sync))
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON, NDJSON and text responses of at least
+    `minimum_size` bytes (and every streamed one) with gzip or zstd, as
+    negotiated with the client.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if start is not None:
+                headers = MutableHeaders(raw=start['headers'])
+                if ('content-encoding' in headers or not compressible(headers.get('content-type', ''))
+                        or (not more_body and len(body) < self.minimum_size)):
+                    # already encoded, binary or not worth it: pass through untouched
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+
+                compressor = _Compressor(coding, self.gzip_level, self.zstd_level)
+                body = compressor.compress(body, final=not more_body)
+                headers['content-encoding'] = coding
+                headers.add_vary_header('Accept-Encoding')
+                if more_body:
+                    del headers['content-length']
+                else:
+                    headers['content-length'] = str(len(body))
+                await send(start)
+                start = None
+                await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+                return
+
+            if compressor is not None:
+                body = compressor.compress(body, final=not more_body)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_compressed)
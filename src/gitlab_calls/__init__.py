@@ -2,6 +2,36 @@
 #     return "Hello from gitlab-calls!"
 
 from .gitlab_calls import *
+from .aggregate import ItemAggregator, aggregate_items_by_year, aggregate_items_by_year_async
+from .export import export_items_by_year, export_items_by_year_async, iter_export_async
+from .jobs import ItemsJob, JobManager
+from .prefetch import Prefetcher
+from .reconcile import reconcile_memberships, reconcile_memberships_async
+from .search import search_items, search_items_async
+from .webhooks import ingest_event, verify_token
+from .cache import ResponseCache, SingleFlight, TTLCache
+from .scheduler import RequestScheduler
+from .store import ItemStore, get_default_store, set_default_store
 #from .gitlab_calls import grant_user_role, get_items_by_year
 
-__all__ = ["bogus", "grant_user_role", "get_items_by_year"]
+__all__ = [
+    "bogus",
+    "grant_user_role", "get_items_by_year",
+    "grant_user_role_async", "get_items_by_year_async",
+    "grant_user_roles", "grant_user_roles_async",
+    "reconcile_memberships", "reconcile_memberships_async",
+    "grant_group_projects", "grant_group_projects_async", "iter_group_project_grants_async",
+    "iter_items_by_year", "iter_items_by_year_async",
+    "count_items_by_year", "count_items_by_year_async",
+    "get_items_page", "get_items_page_async",
+    "search_items", "search_items_async",
+    "sync_store", "sync_store_async",
+    "aggregate_items_by_year", "aggregate_items_by_year_async", "ItemAggregator",
+    "export_items_by_year", "export_items_by_year_async", "iter_export_async",
+    "resolver_cache", "resolver_cache_stats", "invalidate_resolver_cache",
+    "ItemStore", "get_default_store", "set_default_store", "TTLCache", "ResponseCache", "response_cache", "SingleFlight",
+    "RequestScheduler", "get_scheduler",
+    "JobManager", "ItemsJob", "Prefetcher",
+    "ingest_event", "verify_token",
+    "get_client", "aclose_client", "set_transport",
+]
@@ -0,0 +1,167 @@
+"""
+Server-side statistics over merge requests / issues of a year, computed in a
+single streaming pass with compact accumulators (no item is kept):
+  - counts grouped by any of month, state, author, project
+  - time-to-merge / time-to-close percentiles from log-bucketed histograms
+"""
+
+import math
+from datetime import datetime
+
+from .gitlab_calls import iter_items_by_year_async, _run_sync
+
+# Grouping dimensions: name -> key of an item
+DIMENSIONS = {
+    'month': lambda item: (item.get('created_at') or '')[:7],
+    'state': lambda item: item.get('state'),
+    'author': lambda item: (item.get('author') or {}).get('username'),
+    'project': lambda item: item.get('project_id'),
+}
+
+# Only the fields the accumulators read are fetched/kept per page
+FIELDS = ['created_at', 'merged_at', 'closed_at', 'state', 'author.username', 'project_id']
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+
+class DurationHistogram:
+    """
+    Log-bucketed histogram of durations in seconds: constant memory per
+    distinct order of magnitude, percentiles within `precision` relative error.
+    """
+
+    def __init__(self, precision: float = 0.02):
+        self._log_base = math.log1p(2 * precision)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        seconds = max(seconds, 0.0)
+        index = math.floor(math.log(seconds) / self._log_base) if seconds >= 1 else -1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if not self.count:
+            return None
+        rank = p / 100 * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                if index < 0:
+                    return self.min
+                # geometric middle of the bucket, clipped to the observed range
+                middle = math.exp((index + 0.5) * self._log_base)
+                return min(max(middle, self.min), self.max)
+        return self.max
+
+    def summary(self, percentiles) -> dict | None:
+        if not self.count:
+            return None
+        summary = {'count': self.count, 'mean': round(self.total / self.count, 1)}
+        for p in percentiles:
+            summary[f'p{p:g}'] = round(self.percentile(p), 1)
+        return summary
+
+
+class _Group:
+    __slots__ = ('count', 'time_to_merge', 'time_to_close')
+
+    def __init__(self):
+        self.count = 0
+        self.time_to_merge = DurationHistogram()
+        self.time_to_close = DurationHistogram()
+
+
+class ItemAggregator:
+    """
+    Accumulates grouped counts and durations of items fed one by one.
+    """
+
+    def __init__(self, group_by: list[str] = (), percentiles: list[float] = (50, 90, 99)):
+        unknown = [name for name in group_by if name not in DIMENSIONS]
+        if isinstance(group_by, str) or unknown:
+            raise ValueError(f"group_by must be a list of: {', '.join(DIMENSIONS)}")
+        if not all(isinstance(p, (int, float)) and 0 <= p <= 100 for p in percentiles):
+            raise ValueError("percentiles must be numbers between 0 and 100")
+        self.group_by = list(group_by)
+        self.percentiles = list(percentiles)
+        self.total = _Group()
+        self.groups = {}
+
+    def add(self, item: dict) -> None:
+        key = tuple(DIMENSIONS[name](item) for name in self.group_by)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _Group()
+
+        created_at = _parse_time(item.get('created_at'))
+        merged_at = _parse_time(item.get('merged_at'))
+        closed_at = _parse_time(item.get('closed_at'))
+        for target in (group, self.total):
+            target.count += 1
+            if created_at and merged_at:
+                target.time_to_merge.add((merged_at - created_at).total_seconds())
+            if created_at and closed_at:
+                target.time_to_close.add((closed_at - created_at).total_seconds())
+
+    def _summary(self, group: _Group) -> dict:
+        return {
+            'count': group.count,
+            'time_to_merge': group.time_to_merge.summary(self.percentiles),
+            'time_to_close': group.time_to_close.summary(self.percentiles)
+        }
+
+    def result(self) -> dict:
+        """
+        {"total": {...}, "groups": [{<dimension>: value, ..., "count", "time_to_merge", "time_to_close"}]};
+        durations are in seconds, groups are sorted by key.
+        """
+        groups = [
+            {**dict(zip(self.group_by, key)), **self._summary(group)}
+            for key, group in sorted(self.groups.items(), key=lambda entry: tuple(map(str, entry[0])))
+        ]
+        return {
+            'group_by': self.group_by,
+            'total': self._summary(self.total),
+            'groups': groups
+        }
+
+
+async def aggregate_items_by_year_async(item_type: str, year: int, group_by: list[str] = ('month',),
+                                        percentiles: list[float] = (50, 90, 99), **options) -> dict:
+    """
+    Grouped counts and time-to-merge / time-to-close percentiles of the merge
+    requests or issues created in a given year, in one streaming pass.
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit year
+        group_by: Any of 'month', 'state', 'author', 'project'
+        percentiles: Percentiles of the durations to report
+        options: Crawl options of iter_items_by_year_async (concurrency, shard, pagination, use_store)
+
+    Returns:
+        Dictionary with item_type, year and the ItemAggregator result
+    """
+    aggregator = ItemAggregator(group_by, percentiles)
+    async for item in iter_items_by_year_async(item_type, year, fields=FIELDS, **options):
+        aggregator.add(item)
+    return {'item_type': item_type, 'year': year, **aggregator.result()}
+
+
+def aggregate_items_by_year(item_type: str, year: int, group_by: list[str] = ('month',),
+                            percentiles: list[float] = (50, 90, 99), **options) -> dict:
+    """
+    Synchronous wrapper of aggregate_items_by_year_async.
+    """
+    return _run_sync(aggregate_items_by_year_async(item_type, year, group_by, percentiles, **options))
@@ -0,0 +1,232 @@
+"""
+In-process caches used by the GitLab calls.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded mapping whose entries expire `ttl` seconds after they were set and
+    are evicted least-recently-used first beyond `maxsize` entries. Expired
+    entries are swept at most once per `ttl` on set, so unread ones don't linger.
+    Keeps hit/miss counters; safe to share between threads.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept >= self.ttl:
+                self._swept = now
+                for expired in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+                    del self._entries[expired]
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None) -> None:
+        """
+        Drop one entry, or every entry when key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl
+        }
+
+
+class ResponseCache:
+    """
+    Bodies and headers of GET responses with an ETag, revalidated with
+    If-None-Match. Bounded by the total size of the cached bodies, evicted
+    least-recently-used first.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> tuple[str, dict, bytes] | None:
+        """
+        The (etag, headers, body) stored for `key`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, etag: str, headers: dict, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[2])
+            self._entries[key] = (etag, headers, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def record(self, hit: bool) -> None:
+        """
+        Count a revalidation: hit when GitLab answered 304 Not Modified.
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes
+        }
+
+
+_MISSING = object()
+
+
+def _weight(result) -> int:
+    """
+    Items of a result (1 for a result that isn't a list or dict).
+    """
+    return len(result) if isinstance(result, (list, dict)) else 1
+
+
+class SingleFlight:
+    """
+    De-duplicates concurrent calls: callers asking for the same key while a
+    call is in flight await that call instead of starting their own. Results
+    are then kept `ttl` seconds to absorb follow-up bursts: each is dropped by a
+    timer when it expires, and the least recently used go first beyond
+    `max_weight` items in total (see _weight) or `maxsize` keys.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, ttl: float, maxsize: int | None = None, max_weight: int | None = None, weigh=_weight):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.calls = 0
+        self.shared = 0
+        self.hits = 0
+        self._results = OrderedDict()
+        self._in_flight = {}
+
+    async def do(self, key, fn):
+        """
+        Return fn()'s result for `key`, sharing an in-flight or recent call.
+        The call runs as its own task, so a cancelled caller doesn't abort it
+        for the others.
+        """
+        entry = self._results.get(key)
+        if entry is not None:
+            self._results.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task: asyncio.Task) -> None:
+        del self._in_flight[key]
+        if not task.cancelled() and task.exception() is None and self.ttl > 0:
+            self._keep(key, task.result())
+
+    def _keep(self, key, result) -> None:
+        weight = self.weigh(result)
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        self._drop(key)
+        timer = asyncio.get_running_loop().call_later(self.ttl, self._drop, key)
+        self._results[key] = (result, weight, timer)
+        self.weight += weight
+        while ((self.max_weight is not None and self.weight > self.max_weight)
+               or (self.maxsize is not None and len(self._results) > self.maxsize)):
+            self._drop(next(iter(self._results)))
+
+    def _drop(self, key) -> None:
+        entry = self._results.pop(key, None)
+        if entry is not None:
+            _, weight, timer = entry
+            timer.cancel()
+            self.weight -= weight
+
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'in_flight': len(self._in_flight),
+            'cached': {
+                'hits': self.hits,
+                'entries': len(self._results),
+                'weight': self.weight,
+                'max_weight': self.max_weight,
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
+        }
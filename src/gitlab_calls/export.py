@@ -0,0 +1,227 @@
+"""
+Columnar export of the merge requests / issues of a year for analytics
+pipelines: items are flattened into typed columns and written in batches as
+pages stream in, as CSV (stdlib), Arrow IPC stream or Parquet (pyarrow).
+
+pyarrow is optional: without it only CSV is available.
+"""
+
+import csv
+import io
+import os
+from datetime import datetime
+
+from .gitlab_calls import iter_items_by_year_async, _run_sync
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+# Rows per written batch (Arrow record batch / Parquet row group)
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', '10000'))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _get(item: dict, *path):
+    for name in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(name)
+    return item
+
+
+def _time(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+
+def _usernames(users) -> list[str]:
+    return [user.get('username') for user in users or () if isinstance(user, dict)]
+
+
+# name, type (int | str | time | list), value of an item
+COLUMNS = [
+    ('id', 'int', lambda item: item.get('id')),
+    ('iid', 'int', lambda item: item.get('iid')),
+    ('project_id', 'int', lambda item: item.get('project_id')),
+    ('title', 'str', lambda item: item.get('title')),
+    ('state', 'str', lambda item: item.get('state')),
+    ('author_id', 'int', lambda item: _get(item, 'author', 'id')),
+    ('author_username', 'str', lambda item: _get(item, 'author', 'username')),
+    ('assignee_usernames', 'list', lambda item: _usernames(item.get('assignees'))),
+    ('labels', 'list', lambda item: list(item.get('labels') or ())),
+    ('milestone_title', 'str', lambda item: _get(item, 'milestone', 'title')),
+    ('source_branch', 'str', lambda item: item.get('source_branch')),
+    ('target_branch', 'str', lambda item: item.get('target_branch')),
+    ('created_at', 'time', lambda item: _time(item.get('created_at'))),
+    ('updated_at', 'time', lambda item: _time(item.get('updated_at'))),
+    ('merged_at', 'time', lambda item: _time(item.get('merged_at'))),
+    ('closed_at', 'time', lambda item: _time(item.get('closed_at'))),
+    ('web_url', 'str', lambda item: item.get('web_url')),
+]
+
+# Only the fields the columns read are fetched/kept per page
+FIELDS = ['id', 'iid', 'project_id', 'title', 'state', 'author.id', 'author.username', 'assignees.username',
+          'labels', 'milestone.title', 'source_branch', 'target_branch', 'created_at', 'updated_at',
+          'merged_at', 'closed_at', 'web_url']
+
+
+def arrow_schema():
+    types = {
+        'int': pa.int64(),
+        'str': pa.string(),
+        'time': pa.timestamp('ms', tz='UTC'),
+        'list': pa.list_(pa.string()),
+    }
+    return pa.schema([(name, types[kind]) for name, kind, _ in COLUMNS])
+
+
+class _ChunkSink:
+    """
+    Write-only file collecting what a writer emits, drained between batches.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _CSVEncoder:
+    def __init__(self):
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        self._writer.writerow([name for name, _, _ in COLUMNS])
+
+    def encode(self, rows: list[dict]) -> bytes:
+        for item in rows:
+            row = []
+            for _, kind, value in COLUMNS:
+                value = value(item)
+                if kind == 'list':
+                    value = ';'.join(map(str, value))
+                elif kind == 'time' and value is not None:
+                    value = value.isoformat()
+                row.append(value)
+            self._writer.writerow(row)
+        return self.drain()
+
+    def drain(self) -> bytes:
+        data = self._text.getvalue().encode('utf-8')
+        self._text.seek(0)
+        self._text.truncate()
+        return data
+
+    def close(self) -> bytes:
+        return self.drain()
+
+
+class _ArrowEncoder:
+    def __init__(self, format: str):
+        self._schema = arrow_schema()
+        self._sink = _ChunkSink()
+        if format == 'arrow':
+            self._writer = pa.ipc.new_stream(self._sink, self._schema)
+        else:
+            self._writer = pq.ParquetWriter(self._sink, self._schema, compression='zstd')
+
+    def encode(self, rows: list[dict]) -> bytes:
+        columns = [
+            pa.array([value(item) for item in rows], type=field.type)
+            for (_, _, value), field in zip(COLUMNS, self._schema)
+        ]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self._schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def _check_format(format: str) -> None:
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    if format != 'csv' and pa is None:
+        raise ValueError(f"format '{format}' requires pyarrow")
+
+
+def _encoder(format: str):
+    _check_format(format)
+    return _CSVEncoder() if format == 'csv' else _ArrowEncoder(format)
+
+
+async def iter_export_async(item_type: str, year: int, format: str = 'csv',
+                            batch_rows: int = EXPORT_BATCH_ROWS, **options):
+    """
+    Yield the bytes of the merge requests or issues created in a given year
+    exported in `format`, one chunk per batch of `batch_rows` items.
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit year
+        format: 'csv', 'arrow' (IPC stream) or 'parquet'
+        batch_rows: Rows per batch (Arrow record batch / Parquet row group)
+        options: Crawl options of iter_items_by_year_async (concurrency, shard, pagination, use_store)
+
+    Raises:
+        ValueError: On the first iteration, if arguments are invalid
+        Exception: If API request fails
+    """
+    encoder = _encoder(format)
+    rows = []
+    async for item in iter_items_by_year_async(item_type, year, fields=FIELDS, **options):
+        rows.append(item)
+        if len(rows) >= batch_rows:
+            yield encoder.encode(rows)
+            rows = []
+    if rows:
+        yield encoder.encode(rows)
+    yield encoder.close()
+
+
+async def export_items_by_year_async(item_type: str, year: int, out, format: str = 'csv',
+                                     batch_rows: int = EXPORT_BATCH_ROWS, **options) -> None:
+    """
+    Write the export of iter_export_async to `out`, a path or a binary file.
+    """
+    _check_format(format)
+    file = open(out, 'wb') if isinstance(out, (str, os.PathLike)) else out
+    try:
+        async for chunk in iter_export_async(item_type, year, format, batch_rows, **options):
+            file.write(chunk)
+    finally:
+        if file is not out:
+            file.close()
+
+
+def export_items_by_year(item_type: str, year: int, out, format: str = 'csv',
+                         batch_rows: int = EXPORT_BATCH_ROWS, **options) -> None:
+    """
+    Synchronous wrapper of export_items_by_year_async.
+    """
+    return _run_sync(export_items_by_year_async(item_type, year, out, format, batch_rows, **options))
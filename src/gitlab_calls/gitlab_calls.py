@@ -2,145 +2,865 @@
 Functions to call GitLab API :
   - set user permissions
   - querying issues/merge requests
+
+Every call goes through one pooled, keep-alive httpx.AsyncClient. The *_async
+functions are the native API; the plain functions are thin synchronous wrappers
+around them for scripts and tests.
 """
 
-import requests
+import asyncio
+import base64
+import contextlib
+import json
 import os
-from datetime import datetime
+import time
+import weakref
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+from urllib.parse import quote
+
+import httpx
+
+from . import metrics
+from .cache import ResponseCache, TTLCache
+from .scheduler import RequestScheduler
+from .store import ItemStore, get_default_store, utcnow
 #from typing import List, Dict, Literal
 
 # GitLab Configuration
 GITLAB_URL = os.getenv('GITLAB_URL', 'http://localhost:8080')
 GITLAB_TOKEN = os.getenv('GITLAB_TOKEN', '')
 
+# Connection pool / timeouts of the shared async client
+GITLAB_MAX_CONNECTIONS = int(os.getenv('GITLAB_MAX_CONNECTIONS', '20'))
+GITLAB_TIMEOUT = float(os.getenv('GITLAB_TIMEOUT', '30'))
+
+# Retries of throttled (429) / failing (5xx) requests, full-jitter exponential backoff
+GITLAB_MAX_RETRIES = int(os.getenv('GITLAB_MAX_RETRIES', '5'))
+GITLAB_BACKOFF_BASE = float(os.getenv('GITLAB_BACKOFF_BASE', '0.5'))
+GITLAB_BACKOFF_CAP = float(os.getenv('GITLAB_BACKOFF_CAP', '30'))
+
+# Max pages of one listing fetched in parallel
+GITLAB_PAGE_CONCURRENCY = int(os.getenv('GITLAB_PAGE_CONCURRENCY', '8'))
+
+# Adaptive sharding: bisect creation windows holding more items than GitLab counts
+# (it drops the totals headers above 10k rows), down to a minimal window span
+SHARD_MAX_ITEMS = 10000
+SHARD_MIN_WINDOW = timedelta(hours=1)
+
+# Items written to the item store per transaction during a crawl
+STORE_BATCH_SIZE = 1000
+
+# Keyset pagination parameters (GitLab answers with a Link rel="next" header)
+KEYSET_PARAMS = {
+    'pagination': 'keyset',
+    'order_by': 'id',
+    'sort': 'desc'
+}
+
 # Headers for API requests
 HEADERS = {
     'PRIVATE-TOKEN': GITLAB_TOKEN,
     'Content-Type': 'application/json'
 }
 
+# Map role names to GitLab access levels
+ROLE_MAPPING = {
+    'guest': 10,
+    'reporter': 20,
+    'developer': 30,
+    'maintainer': 40,
+    'owner': 50
+}
+
+# Max lookups / member writes in flight for a batch of grants
+GRANT_CONCURRENCY = int(os.getenv('GRANT_CONCURRENCY', '10'))
+
+# Resolver cache of username / project path / group path -> GitLab id
+RESOLVER_CACHE_SIZE = int(os.getenv('RESOLVER_CACHE_SIZE', '10000'))
+RESOLVER_CACHE_TTL = float(os.getenv('RESOLVER_CACHE_TTL', '600'))
+
+resolver_cache = TTLCache(maxsize=RESOLVER_CACHE_SIZE, ttl=RESOLVER_CACHE_TTL)
+
+# ETag cache of GET responses, bounded by the total size of the cached bodies (0 disables)
+GITLAB_RESPONSE_CACHE_BYTES = int(os.getenv('GITLAB_RESPONSE_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+response_cache = ResponseCache(max_bytes=GITLAB_RESPONSE_CACHE_BYTES)
+
+# One client per event loop: httpx connections are bound to the loop that opened them
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_transport: httpx.AsyncBaseTransport | None = None
+# Same for request schedulers: their locks are bound to the loop
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, RequestScheduler]" = weakref.WeakKeyDictionary()
+
+# Item store sync locks, per event loop: (store, item_type[, year]) -> lock
+_store_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+# End-of-source marker of _ordered_chain queues
+_DONE = object()
+
+# Listing endpoint URL -> whether it supports keyset pagination (probed on first use)
+_keyset_support: dict[str, bool] = {}
+
+
+def set_transport(transport: httpx.AsyncBaseTransport | None) -> None:
+    """
+    Route all GitLab calls through a custom httpx transport (e.g. httpx.MockTransport
+    in tests, httpx.ASGITransport for an in-process fake server). None restores the
+    default network transport. Already opened clients are dropped.
+    """
+    global _transport
+    _transport = transport
+    _clients.clear()
+    _schedulers.clear()
+    _keyset_support.clear()
+    response_cache.clear()
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the pooled keep-alive client of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=GITLAB_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=GITLAB_MAX_CONNECTIONS,
+                max_keepalive_connections=GITLAB_MAX_CONNECTIONS
+            ),
+            transport=_transport
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose_client() -> None:
+    """
+    Close the client of the running event loop (call on application shutdown).
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code, closing the loop's client afterwards.
+    """
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await aclose_client()
+
+    return asyncio.run(runner())
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Return the request scheduler of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = RequestScheduler(
+            max_concurrency=GITLAB_MAX_CONNECTIONS,
+            max_retries=GITLAB_MAX_RETRIES,
+            backoff_base=GITLAB_BACKOFF_BASE,
+            backoff_cap=GITLAB_BACKOFF_CAP
+        )
+        _schedulers[loop] = scheduler
+    return scheduler
+
+
+async def _request(method: str, url: str, page: bool = False, **kwargs) -> httpx.Response:
+    """
+    Single entry point for every GitLab HTTP call: admitted, paced and retried
+    by the request scheduler, and measured (see metrics.py); `page` marks the
+    fetch of a listing page (not a count or probe). GETs are revalidated against
+    the response cache with If-None-Match; a 304 is answered with the cached body.
+    """
+    client = get_client()
+    scheduler = get_scheduler()
+
+    async def send(**extra) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await scheduler.send(method, lambda: client.request(method, url, **kwargs, **extra))
+        except httpx.TransportError:
+            metrics.observe_gitlab(method, url, 'error', time.perf_counter() - started, 0)
+            raise
+        metrics.observe_gitlab(method, url, response.status_code, time.perf_counter() - started,
+                               len(response.content), page=page and response.status_code < 400)
+        return response
 
-def grant_user_role(username: str, repo_or_group: str, role: str) -> map:
+    if method != 'GET' or response_cache.max_bytes <= 0:
+        return await send()
+
+    key = str(httpx.URL(url, params=kwargs.get('params')))
+    cached = response_cache.get(key)
+    headers = dict(kwargs.pop('headers', None) or {})
+    if cached is not None:
+        headers['If-None-Match'] = cached[0]
+
+    response = await send(headers=headers)
+
+    if cached is not None:
+        response_cache.record(hit=response.status_code == 304)
+        if response.status_code == 304:
+            etag, cached_headers, body = cached
+            return httpx.Response(200, headers=cached_headers, content=body, request=response.request)
+    if response.status_code == 200 and response.headers.get('etag'):
+        # the body is stored decoded, drop the headers describing its encoding on the wire
+        headers = {name: value for name, value in response.headers.items()
+                   if name not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        response_cache.set(key, response.headers['etag'], headers, response.content)
+    return response
+
+
+def _target_kind(repo_or_group: str) -> str:
+    # Determine if it's a project or group by checking if path contains '/'
+    return 'projects' if '/' in repo_or_group else 'groups'
+
+
+async def _resolve_user_id(username: str) -> int:
+    """
+    GitLab user id of `username`, through the resolver cache.
+    """
+    key = ('users', username)
+    user_id = resolver_cache.get(key)
+    if user_id is not None:
+        return user_id
+
+    # Get user ID by username
+    user_url = f"{GITLAB_URL}/api/v4/users"
+    user_response = await _request('GET', user_url, params={'username': username})
+    user_response.raise_for_status()
+
+    users = user_response.json()
+    if not users:
+        raise Exception(f"User '{username}' not found")
+
+    user_id = users[0]['id']
+    resolver_cache.set(key, user_id)
+    return user_id
+
+
+async def _resolve_target_id(repo_or_group: str, kind: str | None = None) -> int:
+    """
+    GitLab id of a project or group path, through the resolver cache. `kind`
+    ('projects' or 'groups') overrides the guess from the path, e.g. for subgroups.
+    """
+    kind = kind or _target_kind(repo_or_group)
+    key = (kind, repo_or_group)
+    target_id = resolver_cache.get(key)
+    if target_id is not None:
+        return target_id
+
+    target_url = f"{GITLAB_URL}/api/v4/{kind}/{quote(repo_or_group, safe='')}"
+    target_response = await _request('GET', target_url)
+    target_response.raise_for_status()
+    target_id = target_response.json()['id']
+    resolver_cache.set(key, target_id)
+    return target_id
+
+
+def invalidate_resolver_cache(username: str | None = None, repo_or_group: str | None = None) -> None:
+    """
+    Forget cached ids of a user and/or a project or group path; with no argument
+    the whole resolver cache is cleared.
+    """
+    if username is None and repo_or_group is None:
+        resolver_cache.invalidate()
+    if username is not None:
+        resolver_cache.invalidate(('users', username))
+    if repo_or_group is not None:
+        resolver_cache.invalidate((_target_kind(repo_or_group), repo_or_group))
+
+
+def resolver_cache_stats() -> dict:
+    """
+    Hit/miss counters and size of the resolver cache.
+    """
+    return resolver_cache.stats()
+
+
+async def grant_user_role_async(username: str, repo_or_group: str, role: str) -> dict:
     """
     Grant or change role permissions for a user on a repository or group.
-    
+
+    User and project/group ids are resolved through a TTL/LRU cache, so repeated
+    grants cost a single member write.
+
     Args:
         username: GitLab username
         repo_or_group: Repository path (e.g., 'group/repo') or group name
         role: Access level - one of: guest, reporter, developer, maintainer, owner
-    
+
     Returns:
         Dictionary with API response
-        
+
     Raises:
         Exception: If API request fails
     """
-    # Map role names to GitLab access levels
-    role_mapping = {
-        'guest': 10,
-        'reporter': 20,
-        'developer': 30,
-        'maintainer': 40,
-        'owner': 50
-    }
-    
-    if role.lower() not in role_mapping:
-        raise ValueError(f"Invalid role. Must be one of: {', '.join(role_mapping.keys())}")
-    
-    access_level = role_mapping[role.lower()]
-    
-    # Get user ID by username
-    user_url = f"{GITLAB_URL}/api/v4/users?username={username}"
-    user_response = requests.get(user_url, headers=HEADERS)
-    user_response.raise_for_status()
-    
-    users = user_response.json()
-    if not users:
-        raise Exception(f"User '{username}' not found")
-    
-    user_id = users[0]['id']
-    
-    # Determine if it's a project or group by checking if path contains '/'
-    if '/' in repo_or_group:
-        # It's a project (repository)
-        project_url = f"{GITLAB_URL}/api/v4/projects/{requests.utils.quote(repo_or_group, safe='')}"
-        project_response = requests.get(project_url, headers=HEADERS)
-        project_response.raise_for_status()
-        project_id = project_response.json()['id']
-        
-        # Try to update existing member first
-        member_url = f"{GITLAB_URL}/api/v4/projects/{project_id}/members/{user_id}"
-        update_response = requests.put(
-            member_url,
-            headers=HEADERS,
-            json={'access_level': access_level}
-        )
-        
-        # If member doesn't exist (404), add them
-        if update_response.status_code == 404:
-            add_url = f"{GITLAB_URL}/api/v4/projects/{project_id}/members"
-            response = requests.post(
-                add_url,
-                headers=HEADERS,
-                json={'user_id': user_id, 'access_level': access_level}
-            )
-            response.raise_for_status()
-            return response.json()
-        else:
-            update_response.raise_for_status()
-            return update_response.json()
+    if role.lower() not in ROLE_MAPPING:
+        raise ValueError(f"Invalid role. Must be one of: {', '.join(ROLE_MAPPING.keys())}")
+
+    access_level = ROLE_MAPPING[role.lower()]
+
+    user_id = await _resolve_user_id(username)
+    target_id = await _resolve_target_id(repo_or_group)
+
+    return await _write_member(username, repo_or_group, user_id, target_id, access_level)
+
+
+async def _write_member(username: str, repo_or_group: str, user_id: int, target_id: int, access_level: int) -> dict:
+    """
+    Set the access level of a user on a resolved project or group: update the
+    membership, add it when it doesn't exist yet.
+    """
+    kind = _target_kind(repo_or_group)
+
+    # Try to update existing member first
+    member_url = f"{GITLAB_URL}/api/v4/{kind}/{target_id}/members/{user_id}"
+    update_response = await _request('PUT', member_url, json={'access_level': access_level})
+
+    # If member doesn't exist (404), add them
+    if update_response.status_code == 404:
+        return await _add_member(username, repo_or_group, user_id, target_id, access_level)
     else:
-        # It's a group
-        group_url = f"{GITLAB_URL}/api/v4/groups/{requests.utils.quote(repo_or_group, safe='')}"
-        group_response = requests.get(group_url, headers=HEADERS)
-        group_response.raise_for_status()
-        group_id = group_response.json()['id']
-        
-        # Try to update existing member first
-        member_url = f"{GITLAB_URL}/api/v4/groups/{group_id}/members/{user_id}"
-        update_response = requests.put(
-            member_url,
-            headers=HEADERS,
-            json={'access_level': access_level}
-        )
-        
-        # If member doesn't exist (404), add them
-        if update_response.status_code == 404:
-            add_url = f"{GITLAB_URL}/api/v4/groups/{group_id}/members"
-            response = requests.post(
-                add_url,
-                headers=HEADERS,
-                json={'user_id': user_id, 'access_level': access_level}
-            )
-            response.raise_for_status()
-            return response.json()
+        update_response.raise_for_status()
+        return update_response.json()
+
+
+async def _add_member(username: str, repo_or_group: str, user_id: int, target_id: int, access_level: int) -> dict:
+    """
+    Add a user who isn't a member yet to a resolved project or group.
+    """
+    kind = _target_kind(repo_or_group)
+    add_url = f"{GITLAB_URL}/api/v4/{kind}/{target_id}/members"
+    response = await _request(
+        'POST',
+        add_url,
+        json={'user_id': user_id, 'access_level': access_level}
+    )
+    if response.status_code == 404:
+        # the project/group or the user is gone: cached ids are stale
+        invalidate_resolver_cache(username, repo_or_group)
+    response.raise_for_status()
+    return response.json()
+
+
+def grant_user_role(username: str, repo_or_group: str, role: str) -> dict:
+    """
+    Synchronous wrapper of grant_user_role_async.
+    """
+    return _run_sync(grant_user_role_async(username, repo_or_group, role))
+
+
+def _check_concurrency(concurrency: int | None, default: int) -> int:
+    """
+    `concurrency`, or `default` when None.
+
+    Raises:
+        ValueError: If it isn't a positive integer
+    """
+    if concurrency is None:
+        return default
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        raise ValueError("concurrency must be a positive integer")
+    return concurrency
+
+
+async def _bounded_gather(calls, concurrency: int) -> list:
+    """
+    Await every coroutine of `calls` with at most `concurrency` running at once;
+    exceptions are returned in place of results.
+    """
+    limiter = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(call):
+        async with limiter:
+            return await call
+
+    return await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+
+
+async def grant_user_roles_async(grants: list[dict], concurrency: int | None = None) -> list[dict]:
+    """
+    Grant or change roles for many (user, repository or group) pairs at once.
+
+    Every distinct user and project/group is resolved once, then the member
+    writes run concurrently. Grants of the same pair are applied in input order.
+    A failed grant doesn't fail the batch.
+
+    Args:
+        grants: List of {"username", "repo_or_group", "role"} dictionaries
+        concurrency: Max lookups / member writes in flight (default GRANT_CONCURRENCY)
+
+    Returns:
+        One result per grant, in input order:
+        {"username", "repo_or_group", "role", "success": bool, "data" | "error"}
+
+    Raises:
+        ValueError: If concurrency is not a positive integer
+    """
+    concurrency = _check_concurrency(concurrency, GRANT_CONCURRENCY)
+    results = [
+        {'username': grant.get('username'), 'repo_or_group': grant.get('repo_or_group'), 'role': grant.get('role')}
+        for grant in grants
+    ]
+
+    def fail(index: int, error) -> None:
+        results[index].update(success=False, error=str(error))
+
+    pending = []
+    for index, result in enumerate(results):
+        if not result['username'] or not result['repo_or_group']:
+            fail(index, "username and repo_or_group are required")
+        elif not isinstance(result['username'], str) or not isinstance(result['repo_or_group'], str):
+            fail(index, "username and repo_or_group must be strings")
+        elif not isinstance(result['role'], str) or result['role'].lower() not in ROLE_MAPPING:
+            fail(index, f"Invalid role. Must be one of: {', '.join(ROLE_MAPPING.keys())}")
+        else:
+            pending.append(index)
+
+    # Resolve each distinct user and project/group once
+    usernames = list(dict.fromkeys(results[index]['username'] for index in pending))
+    targets = list(dict.fromkeys(results[index]['repo_or_group'] for index in pending))
+    resolved = await _bounded_gather(
+        [_resolve_user_id(username) for username in usernames] +
+        [_resolve_target_id(target) for target in targets],
+        concurrency
+    )
+    user_ids = dict(zip(usernames, resolved[:len(usernames)]))
+    target_ids = dict(zip(targets, resolved[len(usernames):]))
+
+    # Group the grants by (user, target) pair
+    pairs = {}
+    for index in pending:
+        username, target = results[index]['username'], results[index]['repo_or_group']
+        if isinstance(user_ids[username], BaseException):
+            fail(index, user_ids[username])
+        elif isinstance(target_ids[target], BaseException):
+            fail(index, target_ids[target])
         else:
-            update_response.raise_for_status()
-            return update_response.json()
+            pairs.setdefault((username, target), []).append(index)
 
+    async def apply(username: str, target: str, indexes: list[int]) -> None:
+        for index in indexes:
+            try:
+                data = await _write_member(username, target, user_ids[username], target_ids[target],
+                                           ROLE_MAPPING[results[index]['role'].lower()])
+                results[index].update(success=True, data=data)
+            except Exception as e:
+                fail(index, e)
 
-def get_items_by_year(item_type: str, year: int) -> list[map] | None:
+    await _bounded_gather([apply(*pair, indexes) for pair, indexes in pairs.items()], concurrency)
+    return results
+
+
+def grant_user_roles(grants: list[dict], concurrency: int | None = None) -> list[dict]:
     """
-    Retrieve all merge requests or issues created in a given year.
-    
+    Synchronous wrapper of grant_user_roles_async.
+    """
+    return _run_sync(grant_user_roles_async(grants, concurrency))
+
+
+async def iter_group_project_grants_async(username: str, group: str, role: str, include_subgroups: bool = True,
+                                          concurrency: int | None = None):
+    """
+    Grant or change a user's role on every project of a group (and its
+    subgroups), yielding per-project results as the writes complete.
+
+    The user and the group are resolved once; member writes start while the
+    project listing is still being paged and run with bounded parallelism.
+
     Args:
-        item_type: Type of items to retrieve - 'mr' for merge requests or 'issues'
-        year: 4-digit year (e.g., 2023)
-    
+        username: GitLab username
+        group: Group path (e.g. 'mygroup' or 'mygroup/subgroup')
+        role: Access level - one of: guest, reporter, developer, maintainer, owner
+        include_subgroups: Include the projects of every subgroup
+        concurrency: Max member writes in flight (default GRANT_CONCURRENCY)
+
+    Yields:
+        {"project_id", "project", "success": bool, "data" | "error", "done", "total"}
+        where done/total report the progress (total is None when GitLab doesn't count)
+
+    Raises:
+        ValueError: On the first iteration, if the role or concurrency is invalid
+        Exception: If the user, the group or the project listing can't be fetched
+    """
+    if not isinstance(role, str) or role.lower() not in ROLE_MAPPING:
+        raise ValueError(f"Invalid role. Must be one of: {', '.join(ROLE_MAPPING.keys())}")
+    access_level = ROLE_MAPPING[role.lower()]
+    concurrency = _check_concurrency(concurrency, GRANT_CONCURRENCY)
+
+    user_id, group_id = await asyncio.gather(_resolve_user_id(username), _resolve_target_id(group, 'groups'))
+    url = f"{GITLAB_URL}/api/v4/groups/{group_id}/projects"
+    params = {
+        'include_subgroups': str(include_subgroups).lower(),
+        'with_shared': 'false',
+        'simple': 'true',
+        'per_page': 100
+    }
+    total = await _count_window(url, params, asyncio.Semaphore(1))
+
+    limiter = asyncio.Semaphore(max(concurrency, 1))
+    results = asyncio.Queue()
+
+    async def write(project: dict) -> None:
+        result = {'project_id': project['id'], 'project': project['path_with_namespace']}
+        try:
+            data = await _write_member(username, project['path_with_namespace'], user_id, project['id'],
+                                       access_level)
+            result.update(success=True, data=data)
+        except Exception as e:
+            result.update(success=False, error=str(e))
+        finally:
+            limiter.release()
+        await results.put(result)
+
+    async def produce() -> None:
+        writes = []
+        try:
+            async for projects in _iter_pages(url, params, concurrency):
+                for project in projects:
+                    await limiter.acquire()
+                    writes.append(asyncio.ensure_future(write(project)))
+            await asyncio.gather(*writes)
+            await results.put(_DONE)
+        except Exception as exc:
+            await results.put(exc)
+        finally:
+            for task in writes:
+                task.cancel()
+
+    producer = asyncio.ensure_future(produce())
+    done = 0
+    try:
+        while (result := await results.get()) is not _DONE:
+            if isinstance(result, Exception):
+                raise result
+            done += 1
+            yield {**result, 'done': done, 'total': total}
+    finally:
+        producer.cancel()
+
+
+async def grant_group_projects_async(username: str, group: str, role: str, include_subgroups: bool = True,
+                                     concurrency: int | None = None) -> dict:
+    """
+    Grant or change a user's role on every project of a group hierarchy, see
+    iter_group_project_grants_async.
+
     Returns:
-        List of dictionaries containing items data
-        
+        {"username", "group", "role", "total", "failed", "results": [...]} with
+        the per-project results in completion order
+    """
+    results = [result async for result in iter_group_project_grants_async(username, group, role, include_subgroups,
+                                                                          concurrency)]
+    return {
+        'username': username,
+        'group': group,
+        'role': role,
+        'total': len(results),
+        'failed': sum(not result['success'] for result in results),
+        'results': results
+    }
+
+
+def grant_group_projects(username: str, group: str, role: str, include_subgroups: bool = True,
+                         concurrency: int | None = None) -> dict:
+    """
+    Synchronous wrapper of grant_group_projects_async.
+    """
+    return _run_sync(grant_group_projects_async(username, group, role, include_subgroups, concurrency))
+
+
+def _total_pages(headers: httpx.Headers, per_page: int) -> int | None:
+    """
+    Number of pages announced by GitLab, or None when the totals headers are missing
+    (GitLab omits them for result sets above 10k rows).
+    """
+    if headers.get('x-total-pages'):
+        return int(headers['x-total-pages'])
+    if headers.get('x-total'):
+        per_page = int(headers.get('x-per-page') or per_page)
+        return -(-int(headers['x-total']) // per_page)
+    return None
+
+
+async def _ordered_fan_out(fetch, pages, concurrency: int):
+    """
+    Await fetch(page) for every page with at most `concurrency` requests in flight,
+    yielding results in page order.
+    """
+    pages = iter(pages)
+    pending = deque(asyncio.ensure_future(fetch(page)) for page in islice(pages, concurrency))
+    try:
+        while pending:
+            result = await pending.popleft()
+            page = next(pages, None)
+            if page is not None:
+                pending.append(asyncio.ensure_future(fetch(page)))
+            yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _iter_pages(url: str, params: dict, concurrency: int,
+                      limiter: asyncio.Semaphore | None = None, first: httpx.Response | None = None,
+                      keyset: bool = False):
+    """
+    Yield the item lists of every page of a paginated GitLab listing.
+
+    Offset mode: after the first page the remaining ones are fetched concurrently
+    when GitLab announces the page count; otherwise the x-next-page chain is
+    walked serially. Keyset mode follows the Link rel="next" chain, so every page
+    costs GitLab the same as the first.
+    `limiter` caps the requests in flight across several listings, `first` is an
+    already fetched first page.
+    """
+    async def get(target: str, target_params: dict | None) -> httpx.Response:
+        async with limiter or contextlib.nullcontext():
+            response = await _request('GET', target, page=True, params=target_params)
+        response.raise_for_status()
+        return response
+
+    async def fetch(page: int) -> httpx.Response:
+        return await get(url, {**params, 'page': page})
+
+    if keyset:
+        response = first or await get(url, {**params, **KEYSET_PARAMS})
+        while items := response.json():
+            yield items
+            next_url = response.links.get('next', {}).get('url')
+            if not next_url:
+                break
+            # the next link carries the cursor and all the original query parameters
+            response = await get(next_url, None)
+        return
+
+    response = first or await fetch(1)
+    items = response.json()
+    if not items:
+        return
+    yield items
+
+    total_pages = _total_pages(response.headers, params['per_page'])
+    if total_pages is not None:
+        async for response in _ordered_fan_out(fetch, range(2, total_pages + 1), concurrency):
+            items = response.json()
+            if items:
+                yield items
+        return
+
+    # Check if there are more pages
+    while response.headers.get('x-next-page'):
+        response = await fetch(int(response.headers['x-next-page']))
+        items = response.json()
+        if not items:
+            break
+        yield items
+
+
+async def _supports_keyset(url: str, params: dict) -> bool:
+    """
+    Whether a listing endpoint honours keyset pagination. Probed once per endpoint
+    with a single-row request: GitLab either rejects the parameters or silently
+    falls back to offset pagination (x-page headers) when it doesn't support it.
+    Only a definitive answer is cached: a 2xx, or a 400 / 405 / 422 rejecting the
+    parameters (GitLab: 405 Keyset pagination is not yet available...).
+
     Raises:
-        Exception: If API request 
-    """        
-    
+        httpx.HTTPStatusError: On any other error status (auth, rate limit, server)
+    """
+    if url not in _keyset_support:
+        response = await _request('GET', url, params={**params, **KEYSET_PARAMS, 'per_page': 1})
+        if response.status_code in (400, 405, 422):
+            _keyset_support[url] = False
+        else:
+            response.raise_for_status()
+            _keyset_support[url] = 'x-page' not in response.headers
+    return _keyset_support[url]
+
+
+async def _count_window(url: str, window_params: dict, limiter: asyncio.Semaphore) -> int | None:
+    """
+    Number of items in a window from a single-row offset request, None when GitLab
+    doesn't count it.
+    """
+    async with limiter:
+        response = await _request('GET', url, params={**window_params, 'per_page': 1, 'page': 1})
+    response.raise_for_status()
+    total = response.headers.get('x-total')
+    return int(total) if total else None
+
+
+def _isoformat(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _year_windows(year: int, shard: str | None) -> list[tuple[datetime, datetime]]:
+    """
+    Split a year into (start, end) creation windows, newest first to match
+    GitLab's default created_at desc order. Adjacent windows share their boundary
+    second; duplicates are dropped when the windows are merged.
+    """
+    start = datetime(year, 1, 1)
+    end = datetime(year, 12, 31, 23, 59, 59)
+
+    match shard:
+        case None | 'auto':
+            bounds = [start]
+        case 'month':
+            bounds = [datetime(year, month, 1) for month in range(1, 13)]
+        case 'week':
+            bounds = [start + timedelta(weeks=week) for week in range(53) if (start + timedelta(weeks=week)).year == year]
+        case _:
+            raise ValueError("shard must be one of: month, week, auto")
+
+    edges = bounds + [end]
+    return [(edges[i], edges[i + 1]) for i in reversed(range(len(bounds)))]
+
+
+async def _ordered_chain(sources, concurrency: int):
+    """
+    Yield the pages of several async page generators one generator after the
+    other. Up to `concurrency` generators run concurrently, each buffering at
+    most `concurrency` pages ahead of the consumer, so memory stays bounded
+    however long the listing is.
+    """
+    sources = iter(sources)
+    running = deque()
+
+    async def drain(source, queue: asyncio.Queue):
+        try:
+            async for page in source:
+                await queue.put(page)
+            await queue.put(_DONE)
+        except Exception as exc:
+            await queue.put(exc)
+
+    def start_next():
+        source = next(sources, None)
+        if source is not None:
+            queue = asyncio.Queue(maxsize=max(concurrency, 1))
+            running.append((queue, asyncio.ensure_future(drain(source, queue))))
+
+    for _ in range(max(concurrency, 1)):
+        start_next()
+    try:
+        while running:
+            queue, _task = running[0]
+            while (page := await queue.get()) is not _DONE:
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+            running.popleft()
+            start_next()
+    finally:
+        for _queue, task in running:
+            task.cancel()
+
+
+async def _iter_window(url: str, params: dict, start: datetime, end: datetime,
+                       concurrency: int, limiter: asyncio.Semaphore, adaptive: bool, keyset: bool):
+    """
+    Yield the pages of every item created in [start, end]. In adaptive mode a
+    window that GitLab reports as too large (or doesn't count at all) is bisected
+    and both halves are fetched concurrently.
+    """
+    window_params = {**params, 'created_after': _isoformat(start), 'created_before': _isoformat(end)}
+    first = None
+
+    if adaptive and end - start > SHARD_MIN_WINDOW:
+        if keyset:
+            # keyset pages carry no totals, count the window separately
+            total = await _count_window(url, window_params, limiter)
+            too_large = total is None or total > SHARD_MAX_ITEMS
+        else:
+            async with limiter:
+                first = await _request('GET', url, page=True, params={**window_params, 'page': 1})
+            first.raise_for_status()
+            total = first.headers.get('x-total')
+            too_large = bool(first.headers.get('x-next-page')) and (not total or int(total) > SHARD_MAX_ITEMS)
+
+        if too_large:
+            middle = start + (end - start) / 2
+            halves = [
+                _iter_window(url, params, middle, end, concurrency, limiter, adaptive, keyset),
+                _iter_window(url, params, start, middle, concurrency, limiter, adaptive, keyset)
+            ]
+            async for items in _ordered_chain(halves, 2):
+                yield items
+            return
+
+    async for items in _iter_pages(url, window_params, concurrency, limiter, first, keyset):
+        yield items
+
+
+def _compile_fields(fields: list[str]) -> dict:
+    """
+    Turn field paths into a projection tree:
+    ['id', 'author.username'] -> {'id': None, 'author': {'username': None}}.
+    A whole field wins over paths inside it.
+    """
+    if isinstance(fields, str) or not all(isinstance(field, str) and field for field in fields):
+        raise ValueError("fields must be a list of field names or dotted paths")
+    tree = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split('.')
+        for name in parents:
+            if name in node and node[name] is None:
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+def _project(item: dict, tree: dict) -> dict:
+    """
+    Keep only the fields of `tree` in `item`; lists of objects are projected element-wise.
+    """
+    projected = {}
+    for name, sub in tree.items():
+        if name not in item:
+            continue
+        value = item[name]
+        if sub is not None and isinstance(value, dict):
+            value = _project(value, sub)
+        elif sub is not None and isinstance(value, list):
+            value = [_project(element, sub) if isinstance(element, dict) else element for element in value]
+        projected[name] = value
+    return projected
+
+
+async def _projected(pages, tree: dict | None):
+    """
+    Apply a projection to every page of a page generator as it arrives.
+    """
+    async for items in pages:
+        yield [_project(item, tree) for item in items] if tree is not None else items
+
+
+def _check_year(year: int) -> None:
     if not ( 2001 <= year <=  datetime.now().year ): # TODO: add proper min year
         raise ValueError("Value of 'year' argument is Not valid")
-    
-    # Define date range for the year
-    start_date = f"{year}-01-01T00:00:00Z"
-    end_date = f"{year}-12-31T23:59:59Z"
-    
+
+
+def _items_url(item_type: str) -> str:
+    """
+    API endpoint listing all merge requests or issues.
+    """
     # Determine endpoint based on item type
     match item_type:
         case 'mr':
@@ -149,43 +869,454 @@ def get_items_by_year(item_type: str, year: int) -> list[map] | None:
           endpoint = 'issues'
         case _:
            raise ValueError("item_type must be either 'mr' or 'issues'")
-            
-    
-    all_items = []
-    page = 1
-    per_page = 100  # Max items per page
-    
-    while True:
-        # API endpoint for all merge requests/issues
-        url = f"{GITLAB_URL}/api/v4/{endpoint}"
-        
+
+    return f"{GITLAB_URL}/api/v4/{endpoint}"
+
+
+def _store_for(use_store: bool | None) -> ItemStore | None:
+    """
+    Item store to serve from: the default one if configured (use_store=None),
+    required (True) or bypassed (False).
+    """
+    if use_store is False:
+        return None
+    store = get_default_store()
+    if store is None and use_store:
+        raise ValueError("No item store configured (set GITLAB_STORE_PATH)")
+    return store
+
+
+def _store_lock(*key) -> asyncio.Lock:
+    locks = _store_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(key, asyncio.Lock())
+
+
+async def _fill_store(item_type: str, year: int, store: ItemStore, concurrency: int | None,
+                      shard: str | None, pagination: str):
+    """
+    Crawl `year` into the store, yielding the items as they arrive; the year is
+    marked loaded once the crawl completes. The caller holds its _store_lock.
+    """
+    started = utcnow()
+    batch = []
+    async for item in iter_items_by_year_async(item_type, year, concurrency, shard, pagination, use_store=False):
+        batch.append(item)
+        yield item
+        if len(batch) >= STORE_BATCH_SIZE:
+            await asyncio.to_thread(store.upsert, item_type, batch)
+            batch = []
+    await asyncio.to_thread(store.upsert, item_type, batch)
+    await asyncio.to_thread(store.mark_loaded, item_type, year)
+    if await asyncio.to_thread(store.last_sync, item_type) is None:
+        await asyncio.to_thread(store.set_last_sync, item_type, started)
+
+
+async def sync_store_async(item_type: str, year: int, store: ItemStore | None = None,
+                           concurrency: int | None = None, shard: str | None = None,
+                           pagination: str = 'auto', max_age: float | None = None) -> None:
+    """
+    Bring `year` of `item_type` up to date in the item store: the year is crawled
+    once, after that the whole item type is refreshed with
+    updated_after=<last sync>, at most once per store refresh interval.
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit year
+        store: Item store (default: the one configured by GITLAB_STORE_PATH)
+        concurrency, shard, pagination: Crawl options of the initial fill,
+            see get_items_by_year_async
+        max_age: Refresh when the last sync is older than this many seconds
+            (default: the store refresh interval)
+    """
+    _check_year(year)
+    url = _items_url(item_type)
+    store = store or _store_for(True)
+
+    async with _store_lock(store, item_type, year):
+        if not await asyncio.to_thread(store.is_loaded, item_type, year):
+            async for _ in _fill_store(item_type, year, store, concurrency, shard, pagination):
+                pass
+
+    async with _store_lock(store, item_type):
+        if not await asyncio.to_thread(store.needs_refresh, item_type, max_age):
+            return
+        last_sync = await asyncio.to_thread(store.last_sync, item_type)
+        started = utcnow()
         params = {
-            'created_after': start_date,
-            'created_before': end_date,
+            'updated_after': _isoformat(last_sync),
             'scope': 'all',
-            'per_page': per_page,
-            'page': page
+            'per_page': 100
         }
-        
-        response = requests.get(url, headers=HEADERS, params=params)
-        response.raise_for_status()
-        
-        items = response.json()
-        
-        if not items:
-            break
-        
-        all_items.extend(items)
-        
-        # Check if there are more pages
-        if 'x-next-page' not in response.headers or not response.headers['x-next-page']:
-            break
-        
-        page += 1
-    
-    return all_items
+        keyset = pagination == 'keyset' or (pagination == 'auto' and await _supports_keyset(url, params))
+        async for items in _iter_pages(url, params, concurrency or GITLAB_PAGE_CONCURRENCY, keyset=keyset):
+            await asyncio.to_thread(store.upsert, item_type, items)
+        await asyncio.to_thread(store.set_last_sync, item_type, started)
+
+
+def sync_store(item_type: str, year: int, store: ItemStore | None = None) -> None:
+    """
+    Synchronous wrapper of sync_store_async.
+    """
+    return _run_sync(sync_store_async(item_type, year, store))
+
+
+async def iter_items_by_year_async(item_type: str, year: int, concurrency: int | None = None,
+                                   shard: str | None = None, pagination: str = 'auto',
+                                   use_store: bool | None = None, fields: list[str] | None = None):
+    """
+    Lazily yield all merge requests or issues created in a given year, page by page
+    as GitLab returns them. Arguments are the ones of get_items_by_year_async.
+
+    Raises:
+        ValueError: On the first iteration, if arguments are invalid
+        Exception: If API request fails
+    """
+
+    _check_year(year)
+
+    # Define date ranges for the year
+    windows = _year_windows(year, shard)
+
+    # API endpoint for all merge requests/issues
+    url = _items_url(item_type)
 
+    # Projection applied to each page as it arrives; 'id' is kept for de-duplication
+    tree = _compile_fields(fields) if fields is not None else None
+    strip_id = tree is not None and 'id' not in tree
+    if strip_id:
+        tree['id'] = None
+
+    def emit(item: dict) -> dict:
+        if tree is not None:
+            item = _project(item, tree)
+            if strip_id:
+                del item['id']
+        return item
+
+    store = _store_for(use_store)
+    if store is not None:
+        # The first query of a year streams the crawl filling the store (or, while
+        # another query fills it, the plain crawl) instead of waiting for the fill
+        lock = _store_lock(store, item_type, year)
+        if not await asyncio.to_thread(store.is_loaded, item_type, year):
+            if lock.locked():
+                store = None
+            else:
+                async with lock:
+                    if not await asyncio.to_thread(store.is_loaded, item_type, year):
+                        fill = _fill_store(item_type, year, store, concurrency, shard, pagination)
+                        async with contextlib.aclosing(fill):
+                            async for item in fill:
+                                yield emit(item)
+                        return
+
+    if store is not None:
+        await sync_store_async(item_type, year, store, concurrency, shard, pagination)
+        after = None
+        while items := await asyncio.to_thread(store.items_page, item_type, year, after):
+            after = (items[-1]['created_at'], items[-1]['id'])
+            for item in items:
+                yield emit(item)
+        return
+
+    seen = set()
+    pages = _iter_window_pages(url, list(enumerate(windows)), concurrency, shard, pagination, tree)
+    async with contextlib.aclosing(pages):
+        async for _, items in pages:
+            for item in items or ():
+                if item['id'] not in seen:
+                    seen.add(item['id'])
+                    if strip_id:
+                        del item['id']
+                    yield item
+
+
+async def _tagged(index: int, pages):
+    async for items in pages:
+        yield index, items
+    yield index, None
+
+
+async def _iter_window_pages(url: str, windows: list[tuple[int, tuple[datetime, datetime]]],
+                             concurrency: int | None, shard: str | None, pagination: str, tree: dict | None):
+    """
+    Yield (window index, page) for the pages of the given (index, window)
+    creation windows, in window order, then (index, None) once a window is
+    complete. Items are not de-duplicated across windows.
+    """
+    params = {
+        'scope': 'all',
+        'per_page': 100  # Max items per page
+    }
+
+    match pagination:
+        case 'offset':
+          keyset = False
+        case 'keyset':
+          keyset = True
+        case 'auto':
+          keyset = await _supports_keyset(url, params)
+        case _:
+           raise ValueError("pagination must be one of: auto, offset, keyset")
+
+    concurrency = concurrency or GITLAB_PAGE_CONCURRENCY
+    limiter = asyncio.Semaphore(concurrency)
+
+    sources = (
+        _tagged(index, _projected(_iter_window(url, params, *window, concurrency, limiter, shard == 'auto', keyset),
+                                  tree))
+        for index, window in windows
+    )
+
+    async with contextlib.aclosing(_ordered_chain(sources, concurrency)) as entries:
+        async for entry in entries:
+            yield entry
+
+
+def iter_items_by_year(item_type: str, year: int, concurrency: int | None = None,
+                       shard: str | None = None, pagination: str = 'auto',
+                       use_store: bool | None = None, fields: list[str] | None = None):
+    """
+    Synchronous generator wrapper of iter_items_by_year_async, driving it on a
+    private event loop.
+    """
+    loop = asyncio.new_event_loop()
+    items = iter_items_by_year_async(item_type, year, concurrency, shard, pagination, use_store, fields)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(anext(items))
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(items.aclose())
+        loop.run_until_complete(aclose_client())
+        loop.close()
+
+
+async def get_items_by_year_async(item_type: str, year: int, concurrency: int | None = None,
+                                  shard: str | None = None, pagination: str = 'auto',
+                                  use_store: bool | None = None, fields: list[str] | None = None) -> list[dict]:
+    """
+    Retrieve all merge requests or issues created in a given year.
+
+    Args:
+        item_type: Type of items to retrieve - 'mr' for merge requests or 'issues'
+        year: 4-digit year (e.g., 2023)
+        concurrency: Max pages fetched in parallel (default GITLAB_PAGE_CONCURRENCY)
+        shard: Split the year into 'month' or 'week' windows, or 'auto' to bisect
+            windows above SHARD_MAX_ITEMS; windows are crawled concurrently and
+            merged with de-duplication on item id. None crawls the year as one listing.
+        pagination: 'offset' (page=N), 'keyset' (order_by=id, Link rel="next") or
+            'auto' to use keyset whenever the endpoint supports it
+        use_store: Serve from the local item store (see sync_store_async); None
+            uses it when GITLAB_STORE_PATH is configured, False always crawls GitLab
+        fields: Keep only these fields of each item, dotted paths select nested
+            ones (e.g. ['id', 'title', 'author.username']); None keeps everything
+
+    Returns:
+        List of dictionaries containing items data, in GitLab's page order
+        (created_at desc for offset pagination, id desc for keyset)
+
+    Raises:
+        Exception: If API request
+    """
+    return [item async for item in iter_items_by_year_async(item_type, year, concurrency, shard, pagination,
+                                                            use_store, fields)]
+
+
+def get_items_by_year(item_type: str, year: int, concurrency: int | None = None,
+                      shard: str | None = None, pagination: str = 'auto',
+                      use_store: bool | None = None, fields: list[str] | None = None) -> list[dict]:
+    """
+    Synchronous wrapper of get_items_by_year_async.
+    """
+    return _run_sync(get_items_by_year_async(item_type, year, concurrency, shard, pagination, use_store, fields))
+
+
+
+def _encode_cursor(item_type: str, year: int, item: dict) -> str:
+    position = json.dumps([item_type, year, item['created_at'], item['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str, item_type: str, year: int) -> tuple[str, int]:
+    """
+    (created_at, id) of the last item of the previous page.
+    """
+    try:
+        cursor_type, cursor_year, created_at, item_id = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (cursor_type, cursor_year) != (item_type, year):
+        raise ValueError("cursor belongs to another item_type / year")
+    return created_at, item_id
+
+
+def _after(item: dict, position: tuple[str, int]) -> bool:
+    """
+    Whether `item` comes after `position` in created_at desc, id desc order.
+    """
+    created_at = _parse_time(item['created_at'])
+    after = _parse_time(position[0])
+    return created_at < after or (created_at == after and item['id'] < position[1])
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+async def get_items_page_async(item_type: str, year: int, limit: int = 100, cursor: str | None = None,
+                               fields: list[str] | None = None, use_store: bool | None = None) -> dict:
+    """
+    One page of the merge requests or issues created in a given year, newest
+    first (created_at desc, id desc), for clients paging through a year instead
+    of downloading it whole. A page costs about one upstream request.
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit year
+        limit: Items per page (1..1000)
+        cursor: 'next_cursor' of the previous page; None for the first page
+        fields: Keep only these (dotted) fields, see get_items_by_year_async
+        use_store: Page through the local item store; None does so only once the
+            year is loaded there, False always pages GitLab
+
+    Returns:
+        {'items': [...], 'next_cursor': opaque string, None on the last page}
+
+    Raises:
+        ValueError: If arguments or the cursor are invalid
+        Exception: If API request fails
+    """
+    _check_year(year)
+    url = _items_url(item_type)
+    if not isinstance(limit, int) or not 1 <= limit <= 1000:
+        raise ValueError("limit must be an integer between 1 and 1000")
+    position = _decode_cursor(cursor, item_type, year) if cursor else None
+
+    tree = _compile_fields(fields) if fields is not None else None
+    store = _store_for(use_store)
+    if store is not None and not (use_store or await asyncio.to_thread(store.is_loaded, item_type, year)):
+        # no full-year fill for one page: GitLab is paged until the year is loaded
+        store = None
+
+    if store is not None:
+        await sync_store_async(item_type, year, store)
+        items = await asyncio.to_thread(store.items_page, item_type, year, position, limit + 1)
+        more = len(items) > limit
+        items = items[:limit]
+    else:
+        # The cursor bounds the listing with created_before, rounded up to the next
+        # second: items of that second already returned are skipped locally
+        start, end = _year_windows(year, None)[0]
+        if position is not None:
+            end = min(end, _parse_time(position[0]).replace(tzinfo=None, microsecond=0) + timedelta(seconds=1))
+        params = {
+            'scope': 'all',
+            'per_page': 100,
+            'created_after': _isoformat(start),
+            'created_before': _isoformat(end)
+        }
+        items = []
+        page = 1
+        while True:
+            response = await _request('GET', url, page=True, params={**params, 'page': page})
+            response.raise_for_status()
+            items += [item for item in response.json() if position is None or _after(item, position)]
+            has_next = bool(response.headers.get('x-next-page'))
+            if len(items) >= limit or not has_next:
+                break
+            page += 1
+        more = has_next or len(items) > limit
+        items = items[:limit]
+
+    next_cursor = _encode_cursor(item_type, year, items[-1]) if more and items else None
+    if tree is not None:
+        items = [_project(item, tree) for item in items]
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def get_items_page(item_type: str, year: int, limit: int = 100, cursor: str | None = None,
+                   fields: list[str] | None = None, use_store: bool | None = None) -> dict:
+    """
+    Synchronous wrapper of get_items_page_async.
+    """
+    return _run_sync(get_items_page_async(item_type, year, limit, cursor, fields, use_store))
+
+
+async def _count_range(url: str, params: dict, start: datetime, end: datetime,
+                       concurrency: int, limiter: asyncio.Semaphore) -> int:
+    """
+    Number of items created in [start, end]: one single-row request when GitLab
+    reports X-Total, otherwise the window is bisected and the halves counted
+    concurrently. Windows of SHARD_MIN_WINDOW GitLab still doesn't count are walked.
+    """
+    window_params = {**params, 'created_after': _isoformat(start), 'created_before': _isoformat(end)}
+    total = await _count_window(url, window_params, limiter)
+    if total is not None:
+        return total
+
+    if end - start <= SHARD_MIN_WINDOW:
+        return sum([len(items) async for items in _iter_pages(url, window_params, concurrency, limiter)])
+
+    middle = (start + (end - start) / 2).replace(microsecond=0)
+    lower, upper, boundary = await asyncio.gather(
+        _count_range(url, params, start, middle, concurrency, limiter),
+        _count_range(url, params, middle, end, concurrency, limiter),
+        # both halves include the boundary second (created_after/before are inclusive)
+        _count_window(url, {**params, 'created_after': _isoformat(middle), 'created_before': _isoformat(middle)},
+                      limiter)
+    )
+    return lower + upper - (boundary or 0)
+
+
+async def count_items_by_year_async(item_type: str, year: int, concurrency: int | None = None,
+                                    use_store: bool | None = None) -> int:
+    """
+    Number of merge requests or issues created in a given year, without
+    downloading them: a single per_page=1 request reading X-Total, falling back
+    to counting bisected time windows when GitLab omits the total (above 10k rows).
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit year
+        concurrency: Max count requests in parallel (default GITLAB_PAGE_CONCURRENCY)
+        use_store: Count from the local item store; None does so only once the
+            year is loaded there, False always asks GitLab
+
+    Returns:
+        Number of items
+
+    Raises:
+        ValueError: If arguments are invalid
+        Exception: If API request fails
+    """
+    _check_year(year)
+    url = _items_url(item_type)
+
+    store = _store_for(use_store)
+    if store is not None and (use_store or await asyncio.to_thread(store.is_loaded, item_type, year)):
+        await sync_store_async(item_type, year, store, concurrency)
+        return await asyncio.to_thread(store.count, item_type, year)
+
+    concurrency = concurrency or GITLAB_PAGE_CONCURRENCY
+    start, end = _year_windows(year, None)[0]
+    params = {
+        'scope': 'all',
+        'per_page': 100
+    }
+    return await _count_range(url, params, start, end, concurrency, asyncio.Semaphore(concurrency))
+
+
+def count_items_by_year(item_type: str, year: int, concurrency: int | None = None,
+                        use_store: bool | None = None) -> int:
+    """
+    Synchronous wrapper of count_items_by_year_async.
+    """
+    return _run_sync(count_items_by_year_async(item_type, year, concurrency, use_store))
 
 # FOR DEBUG
 if __name__ == '__main__':
-    print (f"call {get_items_by_year('mr', 2018)=}")
\ No newline at end of file
+    print (f"call {get_items_by_year('mr', 2018)=}")
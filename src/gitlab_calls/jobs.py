@@ -0,0 +1,258 @@
+"""
+Background jobs crawling the merge requests / issues of a year, for exports
+too long to hold an HTTP request open.
+
+A job is submitted and returns at once; a bounded pool of worker tasks runs
+the crawls. Jobs report their progress, results are read (or followed as they
+arrive) any time later, identical pending or running jobs are shared, and a
+failed job resumes from the creation windows it didn't complete.
+Jobs always crawl GitLab (the item store is not used). Must be used from a
+single event loop.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+
+from .gitlab_calls import (GITLAB_PAGE_CONCURRENCY, _check_year, _compile_fields, _items_url,
+                           _iter_window_pages, _year_windows)
+
+# Crawls running at the same time
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Seconds a finished job (and its items) is kept
+JOB_RESULT_TTL = float(os.getenv('JOB_RESULT_TTL', '3600'))
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = 'pending', 'running', 'done', 'failed', 'cancelled'
+FINISHED = {DONE, FAILED, CANCELLED}
+
+
+class ItemsJob:
+    """
+    One get_items_by_year crawl and its results. Resuming after a failure skips
+    the creation windows already complete; items are de-duplicated on id.
+    """
+
+    def __init__(self, item_type: str, year: int, shard: str | None, pagination: str, fields: list[str] | None):
+        self.id = uuid.uuid4().hex
+        self.query = {'item_type': item_type, 'year': year, 'shard': shard, 'pagination': pagination,
+                      'fields': fields}
+        self.state = PENDING
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.items = []
+        self.pages = 0
+        # resume checkpoints: month (or week) windows, 'auto' still bisects inside them
+        self.windows = _year_windows(year, 'week' if shard == 'week' else 'month')
+        self.windows_done = set()
+        self._seen = set()
+        self._changed = asyncio.Event()
+
+    @property
+    def key(self) -> str:
+        return json.dumps(self.query, sort_keys=True)
+
+    def progress(self) -> dict:
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'query': self.query,
+            'pages': self.pages,
+            'items': len(self.items),
+            'windows_done': len(self.windows_done),
+            'windows_total': len(self.windows),
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _finish(self, state: str, error: str | None = None) -> None:
+        self.state = state
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    async def run(self, concurrency: int | None = None) -> None:
+        self.state = RUNNING
+        self.error = None
+        self._notify()
+
+        tree = _compile_fields(self.query['fields']) if self.query['fields'] is not None else None
+        strip_id = tree is not None and 'id' not in tree
+        if strip_id:
+            tree['id'] = None
+        windows = [(index, window) for index, window in enumerate(self.windows) if index not in self.windows_done]
+
+        try:
+            pages = _iter_window_pages(_items_url(self.query['item_type']), windows,
+                                       concurrency or GITLAB_PAGE_CONCURRENCY, self.query['shard'],
+                                       self.query['pagination'], tree)
+            async with contextlib.aclosing(pages):
+                async for index, items in pages:
+                    if items is None:
+                        self.windows_done.add(index)
+                        continue
+                    self.pages += 1
+                    for item in items:
+                        if item['id'] not in self._seen:
+                            self._seen.add(item['id'])
+                            if strip_id:
+                                del item['id']
+                            self.items.append(item)
+                    self._notify()
+        except asyncio.CancelledError:
+            self._finish(CANCELLED)
+            raise
+        except Exception as e:
+            self._finish(FAILED, str(e))
+        else:
+            self._finish(DONE)
+
+    async def follow(self, offset: int = 0):
+        """
+        Yield the items from `offset` on, waiting for new ones until the job
+        finishes.
+
+        Raises:
+            RuntimeError: If the job failed or was cancelled
+        """
+        while True:
+            while offset < len(self.items):
+                yield self.items[offset]
+                offset += 1
+            if self.state in FINISHED:
+                if self.state != DONE:
+                    raise RuntimeError(f"job {self.state}: {self.error}" if self.error else f"job {self.state}")
+                return
+            await self._changed.wait()
+
+
+class JobManager:
+    """
+    Queue of ItemsJob run by `workers` worker tasks (started on first submit).
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self.jobs = {}
+        self._queue = None
+        self._workers = []
+        self._running = {}
+
+    def _prune(self) -> None:
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and time.time() - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(max(self.workers, 1))]
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job.state != PENDING:
+                continue
+            task = self._running[job.id] = asyncio.ensure_future(job.run())
+            try:
+                await task
+            except asyncio.CancelledError:
+                # a cancelled job ends it, cancelling the worker (close()) stops it
+                if not task.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            finally:
+                self._running.pop(job.id, None)
+
+    def submit(self, item_type: str, year: int, shard: str | None = None, pagination: str = 'auto',
+               fields: list[str] | None = None) -> ItemsJob:
+        """
+        Queue a crawl of `year` (arguments of get_items_by_year_async), or return
+        the identical job already pending or running.
+
+        Raises:
+            ValueError: If arguments are invalid
+        """
+        _check_year(year)
+        _items_url(item_type)
+        _year_windows(year, shard)
+        if pagination not in ('auto', 'offset', 'keyset'):
+            raise ValueError("pagination must be one of: auto, offset, keyset")
+        if fields is not None:
+            _compile_fields(fields)
+        job = ItemsJob(item_type, year, shard, pagination, fields)
+
+        self._prune()
+        for other in self.jobs.values():
+            if other.key == job.key and other.state in (PENDING, RUNNING):
+                return other
+
+        self._start()
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> ItemsJob:
+        """
+        Raises:
+            KeyError: If there is no such job (or it expired)
+        """
+        self._prune()
+        return self.jobs[job_id]
+
+    def resume(self, job_id: str) -> ItemsJob:
+        """
+        Queue a failed or cancelled job again; it continues with the creation
+        windows it didn't complete.
+
+        Raises:
+            KeyError: If there is no such job
+            ValueError: If the job didn't fail
+        """
+        job = self.get(job_id)
+        if job.state not in (FAILED, CANCELLED):
+            raise ValueError(f"job is {job.state}, only failed or cancelled jobs can be resumed")
+        job.state = PENDING
+        job.finished_at = None
+        job._notify()
+        self._start()
+        self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id: str) -> ItemsJob:
+        """
+        Raises:
+            KeyError: If there is no such job
+        """
+        job = self.get(job_id)
+        if job.id in self._running:
+            self._running[job.id].cancel()
+        elif job.state == PENDING:
+            job._finish(CANCELLED)
+        return job
+
+    async def close(self) -> None:
+        """
+        Cancel the running jobs and stop the workers.
+        """
+        tasks = [*self._workers, *self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def stats(self) -> dict:
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {'workers': self.workers, 'jobs': len(self.jobs), 'states': states}
@@ -0,0 +1,113 @@
+"""
+Prometheus metrics of the GitLab calls, and per-request accounting of the
+upstream calls made on behalf of one API request.
+
+prometheus_client is optional: without it every metric is a no-op.
+"""
+
+import contextvars
+import logging
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+logger = logging.getLogger('gitlab_calls.requests')
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+if prometheus_client is not None:
+    GITLAB_REQUESTS = Counter('gitlab_requests_total', 'GitLab API requests',
+                              ['endpoint', 'method', 'status'])
+    GITLAB_LATENCY = Histogram('gitlab_request_duration_seconds',
+                               'GitLab API request latency, queueing and retries included',
+                               ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+    GITLAB_BYTES = Counter('gitlab_response_bytes_total', 'GitLab API response body bytes', ['endpoint'])
+    GITLAB_RETRIES = Counter('gitlab_retries_total', 'GitLab API request retries', ['reason'])
+    HTTP_REQUESTS = Counter('http_requests_total', 'API requests served', ['route', 'method', 'status'])
+    HTTP_LATENCY = Histogram('http_request_duration_seconds', 'API request latency',
+                             ['route', 'method'], buckets=LATENCY_BUCKETS)
+else:  # pragma: no cover - optional dependency
+    GITLAB_REQUESTS = GITLAB_LATENCY = GITLAB_BYTES = GITLAB_RETRIES = _NoopMetric()
+    HTTP_REQUESTS = HTTP_LATENCY = _NoopMetric()
+
+
+def endpoint_label(url: str) -> str:
+    """
+    Low-cardinality label of a GitLab API URL: ids and paths replaced by ':id',
+    e.g. .../api/v4/projects/group%2Fproj/members/7 -> 'projects/:id/members/:id'.
+    """
+    path = url.split('?', 1)[0].split('/api/v4/', 1)[-1].strip('/')
+    return '/'.join(':id' if index % 2 else part for index, part in enumerate(path.split('/')))
+
+
+class RequestStats:
+    """
+    Upstream calls made on behalf of one API request; pages are the listing
+    pages among them (counts and probes excluded).
+    """
+    __slots__ = ('requests', 'pages', 'bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.pages = 0
+        self.bytes = 0
+
+
+_current = contextvars.ContextVar('gitlab_request_stats', default=None)
+
+
+def track_request() -> RequestStats:
+    """
+    Start accounting the GitLab calls of the current context (and the tasks it spawns).
+    """
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def observe_gitlab(method: str, url: str, status: int | str, seconds: float, size: int,
+                   page: bool = False) -> None:
+    endpoint = endpoint_label(url)
+    GITLAB_REQUESTS.labels(endpoint, method, str(status)).inc()
+    GITLAB_LATENCY.labels(endpoint, method).observe(seconds)
+    GITLAB_BYTES.labels(endpoint).inc(size)
+    stats = _current.get()
+    if stats is not None:
+        stats.requests += 1
+        stats.pages += page
+        stats.bytes += size
+
+
+def observe_retry(reason: int | str) -> None:
+    GITLAB_RETRIES.labels(str(reason)).inc()
+
+
+def observe_route(route: str, method: str, status: int, seconds: float, stats: RequestStats) -> None:
+    HTTP_REQUESTS.labels(route, method, str(status)).inc()
+    HTTP_LATENCY.labels(route, method).observe(seconds)
+    logger.info('%s %s %s %.1fms gitlab_requests=%d gitlab_pages=%d gitlab_bytes=%d',
+                method, route, status, seconds * 1000, stats.requests, stats.pages, stats.bytes)
+
+
+def exposition() -> tuple[bytes, str] | None:
+    """
+    (body, content type) of the Prometheus text exposition; None without prometheus_client.
+    """
+    if prometheus_client is None:
+        return None
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,177 @@
+"""
+Background prefetch of the most requested (item_type, year) queries into the
+item store, so user requests find their year loaded and recently synced.
+
+Requests are counted per (item_type, year) with a decay per round. Every
+PREFETCH_INTERVAL seconds (with jitter), the PREFETCH_TOP most requested are
+loaded or delta-synced, within PREFETCH_BUDGET upstream requests per round.
+PREFETCH_WARMUP queries are counted from the start, so the first round after
+a deploy warms them. Needs an item store (GITLAB_STORE_PATH): without one
+prefetching stays off. Must be used from a single event loop.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime
+
+from . import metrics
+from .gitlab_calls import _check_year, _items_url, _store_for, sync_store_async
+from .store import get_default_store
+
+logger = logging.getLogger('gitlab_calls.prefetch')
+
+# Seconds between prefetch rounds; 0 disables prefetching
+PREFETCH_INTERVAL = float(os.getenv('PREFETCH_INTERVAL', '0'))
+# (item_type, year) queries kept warm
+PREFETCH_TOP = int(os.getenv('PREFETCH_TOP', '4'))
+# Random +/- fraction of the interval between rounds
+PREFETCH_JITTER = float(os.getenv('PREFETCH_JITTER', '0.1'))
+# Max upstream requests of one round; a crawl exceeding it is stopped
+PREFETCH_BUDGET = int(os.getenv('PREFETCH_BUDGET', '2000'))
+# Queries warmed by the first round: item_type:year list, 'current' for the current year
+PREFETCH_WARMUP = os.getenv('PREFETCH_WARMUP', 'mr:current,issues:current')
+
+# Seconds between budget checks of a running crawl
+BUDGET_CHECK_INTERVAL = 0.1
+
+
+def parse_queries(spec: str) -> list[tuple[str, int]]:
+    """
+    'mr:2024,issues:current' -> [('mr', 2024), ('issues', <current year>)]
+
+    Raises:
+        ValueError: If an entry is invalid
+    """
+    queries = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        item_type, _, year = entry.partition(':')
+        if not year:
+            raise ValueError(f"Invalid prefetch query '{entry}', expected item_type:year")
+        year = datetime.now().year if year == 'current' else int(year)
+        _items_url(item_type)
+        _check_year(year)
+        queries.append((item_type, year))
+    return queries
+
+
+class Prefetcher:
+    """
+    Request frequency of (item_type, year) queries, and the task keeping the
+    most requested ones warm in the item store (started by start()).
+    """
+
+    def __init__(self, interval: float = PREFETCH_INTERVAL, top: int = PREFETCH_TOP,
+                 jitter: float = PREFETCH_JITTER, budget: int = PREFETCH_BUDGET,
+                 warmup: str = PREFETCH_WARMUP, decay: float = 0.5):
+        self.interval = interval
+        self.top = top
+        self.jitter = jitter
+        self.budget = budget
+        self.decay = decay
+        self.counts = dict.fromkeys(parse_queries(warmup), 1.0)
+        self.rounds = 0
+        self.last_round = None
+        self._task = None
+
+    def record(self, item_type: str, year: int) -> None:
+        """
+        Count a request of `year` of `item_type`; invalid queries are ignored.
+        """
+        try:
+            _items_url(item_type)
+            _check_year(year)
+        except (TypeError, ValueError):
+            return
+        self.counts[(item_type, year)] = self.counts.get((item_type, year), 0.0) + 1
+
+    def hot(self) -> list[tuple[str, int]]:
+        """
+        The `top` most requested queries, most requested first.
+        """
+        return sorted(self.counts, key=self.counts.get, reverse=True)[:self.top]
+
+    async def run_round(self) -> dict:
+        """
+        Load or delta-sync the hot queries, stopping once the round used its
+        budget of upstream requests; then decay the request counts.
+
+        Returns:
+            {"warmed", "failed", "skipped": [[item_type, year], ...], "requests"}
+
+        Raises:
+            ValueError: If no item store is configured
+        """
+        store = _store_for(True)
+        # synced a little ahead, so the data doesn't go stale before the next round
+        max_age = max(store.refresh_interval - self.interval * (1 + self.jitter), 0)
+        stats = metrics.track_request()
+        result = {'warmed': [], 'failed': [], 'skipped': [], 'requests': 0}
+
+        for item_type, year in self.hot():
+            if stats.requests >= self.budget:
+                result['skipped'].append([item_type, year])
+                continue
+            task = asyncio.ensure_future(sync_store_async(item_type, year, store, max_age=max_age))
+            try:
+                while not task.done():
+                    await asyncio.wait({task}, timeout=BUDGET_CHECK_INTERVAL)
+                    if not task.done() and stats.requests >= self.budget:
+                        task.cancel()
+                        await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            if task.cancelled():
+                result['skipped'].append([item_type, year])
+            elif task.exception() is not None:
+                logger.warning('prefetch of %s %s failed: %s', item_type, year, task.exception())
+                result['failed'].append([item_type, year])
+            else:
+                result['warmed'].append([item_type, year])
+
+        for query in list(self.counts):
+            self.counts[query] *= self.decay
+            if self.counts[query] < 0.01:
+                del self.counts[query]
+        result['requests'] = stats.requests
+        self.rounds += 1
+        self.last_round = result
+        return result
+
+    async def _run(self) -> None:
+        await asyncio.sleep(random.uniform(0, self.jitter * self.interval))
+        while True:
+            try:
+                await self.run_round()
+            except Exception as e:
+                logger.warning('prefetch round failed: %s', e)
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def start(self) -> None:
+        """
+        Start the prefetch rounds (no-op when the interval is 0, no item store is
+        configured or already started).
+        """
+        if self.interval > 0 and get_default_store() is None:
+            logger.warning('prefetch disabled: no item store configured (set GITLAB_STORE_PATH)')
+        elif self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.interval > 0 and get_default_store() is not None,
+            'interval': self.interval,
+            'budget': self.budget,
+            'hot': [[item_type, year, round(self.counts[(item_type, year)], 2)]
+                    for item_type, year in self.hot()],
+            'rounds': self.rounds,
+            'last_round': self.last_round
+        }
@@ -0,0 +1,125 @@
+"""
+Desired-state membership reconciler: brings GitLab memberships in line with a
+manifest of (user, project or group, role) entries.
+
+The current direct members of every target are listed once (paginated
+/members), diffed in memory against the manifest, and only the missing
+memberships (POST) and access level changes (PUT) are written. Memberships
+absent from the manifest are left alone.
+"""
+
+from .gitlab_calls import (GITLAB_URL, GRANT_CONCURRENCY, ROLE_MAPPING, _add_member, _bounded_gather,
+                           _check_concurrency, _iter_pages, _resolve_target_id, _resolve_user_id, _run_sync,
+                           _target_kind, _write_member)
+
+
+async def _list_members(repo_or_group: str, target_id: int, concurrency: int) -> dict:
+    """
+    username -> access level of the direct members of a project or group.
+    """
+    url = f"{GITLAB_URL}/api/v4/{_target_kind(repo_or_group)}/{target_id}/members"
+    members = {}
+    async for page in _iter_pages(url, {'per_page': 100}, concurrency):
+        for member in page:
+            members[member['username']] = member['access_level']
+    return members
+
+
+async def reconcile_memberships_async(manifest: list[dict], dry_run: bool = False,
+                                      concurrency: int | None = None) -> dict:
+    """
+    Apply a membership manifest, writing only what differs from GitLab.
+
+    Args:
+        manifest: List of {"username", "repo_or_group", "role"} dictionaries; the
+            last entry of a (username, repo_or_group) pair wins
+        dry_run: Only compute the changes, write nothing
+        concurrency: Max lookups / member writes in flight (default GRANT_CONCURRENCY)
+
+    Returns:
+        {"dry_run", "targets", "added", "updated", "unchanged", "failed",
+         "changes": [{"username", "repo_or_group", "role", "action": "add" | "update",
+                      "from_level", "to_level", "success", "error"?}, ...]}
+        changes lists the invalid entries, then every membership that needed a
+        write or couldn't be checked
+
+    Raises:
+        ValueError: If concurrency is not a positive integer
+    """
+    concurrency = _check_concurrency(concurrency, GRANT_CONCURRENCY)
+    changes = []
+    failed = 0
+
+    desired = {}
+    for entry in manifest:
+        username, target, role = entry.get('username'), entry.get('repo_or_group'), entry.get('role')
+        if not username or not target:
+            error = "username and repo_or_group are required"
+        elif not isinstance(username, str) or not isinstance(target, str):
+            error = "username and repo_or_group must be strings"
+        elif not isinstance(role, str) or role.lower() not in ROLE_MAPPING:
+            error = f"Invalid role. Must be one of: {', '.join(ROLE_MAPPING.keys())}"
+        else:
+            desired[(username, target)] = role.lower()
+            continue
+        failed += 1
+        changes.append({'username': username, 'repo_or_group': target, 'role': role, 'action': None,
+                        'success': False, 'error': error})
+
+    # One id lookup and one member listing per target
+    targets = list(dict.fromkeys(target for _, target in desired))
+    target_ids = dict(zip(targets, await _bounded_gather([_resolve_target_id(t) for t in targets], concurrency)))
+    listable = [target for target in targets if not isinstance(target_ids[target], BaseException)]
+    members = dict(zip(listable, await _bounded_gather(
+        [_list_members(target, target_ids[target], concurrency) for target in listable], concurrency)))
+
+    unchanged = 0
+    planned = []
+    for (username, target), role in desired.items():
+        change = {'username': username, 'repo_or_group': target, 'role': role}
+        current = target_ids[target] if isinstance(target_ids[target], BaseException) else members[target]
+        if isinstance(current, BaseException):
+            failed += 1
+            changes.append({**change, 'action': None, 'success': False, 'error': str(current)})
+            continue
+        level = current.get(username)
+        if level == ROLE_MAPPING[role]:
+            unchanged += 1
+            continue
+        change.update(action='add' if level is None else 'update', from_level=level, to_level=ROLE_MAPPING[role])
+        planned.append(change)
+        changes.append(change)
+
+    async def apply(change: dict) -> None:
+        username, target = change['username'], change['repo_or_group']
+        try:
+            user_id = await _resolve_user_id(username)
+            write = _add_member if change['action'] == 'add' else _write_member
+            await write(username, target, user_id, target_ids[target], change['to_level'])
+            change['success'] = True
+        except Exception as e:
+            change.update(success=False, error=str(e))
+
+    if dry_run:
+        for change in planned:
+            change['success'] = True
+    else:
+        await _bounded_gather([apply(change) for change in planned], concurrency)
+
+    failed += sum(not change['success'] for change in planned)
+    return {
+        'dry_run': dry_run,
+        'targets': len(targets),
+        'added': sum(change['action'] == 'add' and change['success'] for change in planned),
+        'updated': sum(change['action'] == 'update' and change['success'] for change in planned),
+        'unchanged': unchanged,
+        'failed': failed,
+        'changes': changes
+    }
+
+
+def reconcile_memberships(manifest: list[dict], dry_run: bool = False, concurrency: int | None = None) -> dict:
+    """
+    Synchronous wrapper of reconcile_memberships_async.
+    """
+    return _run_sync(reconcile_memberships_async(manifest, dry_run, concurrency))
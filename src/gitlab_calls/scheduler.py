@@ -0,0 +1,170 @@
+"""
+Rate-limit-aware scheduler every GitLab request goes through.
+
+- concurrency adapts AIMD-style: halved on 429 (once per window: throttled
+  requests admitted before the last decrease don't halve it again), grows back
+  by ~1 per window of successful requests up to max_concurrency
+- RateLimit-Remaining / RateLimit-Reset spread the remaining budget evenly over
+  the reset window once it runs low, Retry-After pauses every request
+- throttled (429) responses, 5xx responses and transport errors of idempotent
+  requests are retried with full-jitter exponential backoff
+"""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from . import metrics
+
+RETRY_STATUSES = {500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """
+    Seconds to wait before retrying, from Retry-After (seconds or HTTP date),
+    or from RateLimit-Reset (epoch seconds) when the response is a 429 or the
+    rate limit is exhausted (RateLimit-Remaining: 0).
+    """
+    value = response.headers.get('retry-after')
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    reset = response.headers.get('ratelimit-reset')
+    exhausted = response.status_code == 429 or response.headers.get('ratelimit-remaining', '').strip() == '0'
+    if reset and exhausted:
+        try:
+            return max(float(reset) - time.time(), 0.0)
+        except ValueError:
+            pass
+    return None
+
+
+class RequestScheduler:
+    """
+    Admission control, pacing and retries of the requests of one event loop.
+    """
+
+    def __init__(self, max_concurrency: int, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0, low_watermark: float = 0.1):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # fraction of RateLimit-Limit below which requests get paced
+        self.low_watermark = low_watermark
+
+        self.limit = float(max_concurrency)
+        self.interval = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._next_slot = 0.0
+        # self.requests when the limit was last halved
+        self._decreased_at = 0
+        self._cond = asyncio.Condition()
+
+    async def _acquire(self) -> None:
+        async with self._cond:
+            while self._in_flight >= int(self.limit):
+                await self._cond.wait()
+            self._in_flight += 1
+
+        now = time.monotonic()
+        start = max(now, self._next_slot, self._paused_until)
+        self._next_slot = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _release(self) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _observe(self, response: httpx.Response, admitted: int | None = None) -> None:
+        """
+        Adapt concurrency and pacing to a response; `admitted` is the request
+        count when the request was admitted (None: admitted now).
+        """
+        if response.status_code == 429:
+            self.throttled += 1
+            if admitted is None or admitted > self._decreased_at:
+                self.limit = max(1.0, self.limit / 2)
+                self._decreased_at = self.requests
+            wait = retry_after(response)
+            if wait:
+                self._paused_until = max(self._paused_until, time.monotonic() + wait)
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+        remaining = response.headers.get('ratelimit-remaining')
+        reset = response.headers.get('ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining, window = int(remaining), float(reset) - time.time()
+            quota = int(response.headers.get('ratelimit-limit') or 0)
+        except ValueError:
+            return
+        if window > 0 and remaining <= max(quota * self.low_watermark, self.limit):
+            self.interval = window / max(remaining, 1)
+        else:
+            self.interval = 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def send(self, method: str, send) -> httpx.Response:
+        """
+        Run `send()` (a coroutine function issuing the request) under admission
+        control, retrying throttled and transient failures.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                self.requests += 1
+                admitted = self.requests
+                response = await send()
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                response = None
+            finally:
+                await self._release()
+
+            if response is not None:
+                self._observe(response, admitted)
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = max(retry_after(response) or 0.0, self._backoff(attempt))
+                metrics.observe_retry(response.status_code)
+            else:
+                delay = self._backoff(attempt)
+                metrics.observe_retry('transport')
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            'limit': int(self.limit),
+            'in_flight': self._in_flight,
+            'interval': self.interval,
+            'requests': self.requests,
+            'retries': self.retries,
+            'throttled': self.throttled
+        }
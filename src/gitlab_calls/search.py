@@ -0,0 +1,67 @@
+"""
+Search over the merge requests / issues held in the item store: filters on
+author, assignee, labels, state, project and milestone, combined with AND and
+answered from the store's secondary indexes instead of a crawl.
+"""
+
+import asyncio
+
+from .gitlab_calls import _check_year, _compile_fields, _items_url, _project, _run_sync, _store_for, sync_store_async
+
+# Filters of search_items_async, matched against the indexed store columns
+FILTERS = ('author', 'assignee', 'labels', 'state', 'project_id', 'milestone')
+
+
+async def search_items_async(item_type: str, year: int | None = None, sort: str = 'created_at',
+                             order: str = 'desc', limit: int = 100, fields: list[str] | None = None,
+                             **filters) -> list[dict]:
+    """
+    Stored merge requests or issues matching all the given filters.
+
+    With a year, that year is loaded into the store first (and delta-synced like
+    get_items_by_year_async with use_store); without one, the items already held
+    (previously crawled years, webhook deliveries) are searched as they are.
+
+    Args:
+        item_type: 'mr' or 'issues'
+        year: 4-digit creation year, None for every stored item
+        sort: 'created_at' or 'updated_at'
+        order: 'desc' or 'asc'
+        limit: Max items returned (1..1000)
+        fields: Keep only these (dotted) fields, see get_items_by_year_async
+        filters: Any of author (username), assignee (username), labels (list, all
+            required), state, project_id, milestone (title)
+
+    Returns:
+        Matching items, sorted
+
+    Raises:
+        ValueError: If arguments are invalid or no item store is configured
+        Exception: If API request fails
+    """
+    _items_url(item_type)
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}; must be any of: {', '.join(FILTERS)}")
+    labels = filters.get('labels')
+    if labels is not None and (isinstance(labels, str) or not all(isinstance(label, str) for label in labels)):
+        raise ValueError("labels must be a list of label names")
+    if not isinstance(limit, int) or not 1 <= limit <= 1000:
+        raise ValueError("limit must be an integer between 1 and 1000")
+    tree = _compile_fields(fields) if fields is not None else None
+
+    store = _store_for(True)
+    if year is not None:
+        _check_year(year)
+        await sync_store_async(item_type, year, store)
+    items = await asyncio.to_thread(store.search, item_type, year, sort=sort, order=order, limit=limit,
+                                    **{name: value for name, value in filters.items() if value is not None})
+    return [_project(item, tree) for item in items] if tree is not None else items
+
+
+def search_items(item_type: str, year: int | None = None, sort: str = 'created_at', order: str = 'desc',
+                 limit: int = 100, fields: list[str] | None = None, **filters) -> list[dict]:
+    """
+    Synchronous wrapper of search_items_async.
+    """
+    return _run_sync(search_items_async(item_type, year, sort, order, limit, fields, **filters))
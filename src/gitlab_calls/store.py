@@ -0,0 +1,317 @@
+"""
+Local persistent store of GitLab merge requests and issues.
+
+Items are kept in SQLite keyed by (item_type, project_id, id). A year is filled
+once by a full crawl; afterwards the whole item type is refreshed incrementally
+with updated_after=<last sync> (see gitlab_calls.sync_store_async).
+
+State, author, milestone, labels and assignees are also kept in indexed
+columns / tables so stored items can be searched without scanning them.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Path of the default store; unset disables it
+GITLAB_STORE_PATH = os.getenv('GITLAB_STORE_PATH', '')
+# Minimal age of the last delta sync before the next one, in seconds
+GITLAB_STORE_REFRESH = float(os.getenv('GITLAB_STORE_REFRESH', '300'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_type   TEXT    NOT NULL,
+    project_id  INTEGER NOT NULL,
+    id          INTEGER NOT NULL,
+    created_at  TEXT    NOT NULL,
+    updated_at  TEXT,
+    data        TEXT    NOT NULL,
+    PRIMARY KEY (item_type, project_id, id)
+);
+CREATE INDEX IF NOT EXISTS items_by_created ON items (item_type, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS loaded_years (
+    item_type   TEXT    NOT NULL,
+    year        INTEGER NOT NULL,
+    PRIMARY KEY (item_type, year)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    item_type   TEXT    PRIMARY KEY,
+    last_sync   TEXT    NOT NULL
+);
+"""
+
+# Schema migrations, the n-th one brings a store to PRAGMA user_version n + 1
+MIGRATIONS = [
+    # 1: search indexes (state, author, milestone columns; label and assignee tables)
+    """
+    ALTER TABLE items ADD COLUMN state TEXT;
+    ALTER TABLE items ADD COLUMN author TEXT;
+    ALTER TABLE items ADD COLUMN milestone TEXT;
+    CREATE INDEX items_by_state ON items (item_type, state, created_at DESC, id DESC);
+    CREATE INDEX items_by_author ON items (item_type, author, created_at DESC, id DESC);
+    CREATE INDEX items_by_milestone ON items (item_type, milestone, created_at DESC, id DESC);
+    CREATE INDEX items_by_project ON items (item_type, project_id, created_at DESC, id DESC);
+    CREATE INDEX items_by_updated ON items (item_type, updated_at DESC, id DESC);
+    CREATE TABLE item_labels (
+        item_type   TEXT    NOT NULL,
+        project_id  INTEGER NOT NULL,
+        id          INTEGER NOT NULL,
+        label       TEXT    NOT NULL,
+        PRIMARY KEY (item_type, project_id, id, label)
+    );
+    CREATE INDEX item_labels_by_label ON item_labels (item_type, label);
+    CREATE TABLE item_assignees (
+        item_type   TEXT    NOT NULL,
+        project_id  INTEGER NOT NULL,
+        id          INTEGER NOT NULL,
+        username    TEXT    NOT NULL,
+        PRIMARY KEY (item_type, project_id, id, username)
+    );
+    CREATE INDEX item_assignees_by_username ON item_assignees (item_type, username);
+    """,
+]
+
+SORTS = ('created_at', 'updated_at')
+
+
+def _attribute(item: dict, name: str, field: str) -> str | None:
+    value = item.get(name)
+    return value.get(field) if isinstance(value, dict) else None
+
+
+def _index_values(item: dict) -> tuple[str | None, str | None, str | None, set[str], set[str]]:
+    """
+    state, author username, milestone title, labels and assignee usernames of an item.
+    """
+    labels = {label if isinstance(label, str) else label.get('name')
+              for label in item.get('labels') or () if isinstance(label, (str, dict))}
+    assignees = {assignee.get('username') for assignee in item.get('assignees') or () if isinstance(assignee, dict)}
+    if not assignees and _attribute(item, 'assignee', 'username'):
+        assignees = {item['assignee']['username']}
+    return (item.get('state'), _attribute(item, 'author', 'username'), _attribute(item, 'milestone', 'title'),
+            labels - {None}, assignees - {None})
+
+
+def _merge_item(stored: dict, update: dict) -> dict:
+    """
+    `stored` with the fields of `update`; a nested object of the same id (author,
+    milestone, ...) is merged too, so details `update` lacks are kept.
+    """
+    merged = dict(stored)
+    for name, value in update.items():
+        current = merged.get(name)
+        if (isinstance(value, dict) and isinstance(current, dict)
+                and value.get('id') is not None and value.get('id') == current.get('id')):
+            value = {**current, **value}
+        merged[name] = value
+    return merged
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ItemStore:
+    """
+    Thread-safe SQLite store of items. Methods are blocking; async callers run
+    them with asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, refresh_interval: float = GITLAB_STORE_REFRESH):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        (version,) = self._db.execute('PRAGMA user_version').fetchone()
+        for number, script in enumerate(MIGRATIONS[version:], version + 1):
+            with self._db:
+                for statement in filter(str.strip, script.split(';')):
+                    self._db.execute(statement)
+                if number == 1:
+                    rows = self._db.execute('SELECT item_type, project_id, id, data FROM items').fetchall()
+                    indexed = []
+                    for *key, data in rows:
+                        state, author, milestone, labels, assignees = _index_values(json.loads(data))
+                        self._db.execute('UPDATE items SET state = ?, author = ?, milestone = ? '
+                                         'WHERE item_type = ? AND project_id = ? AND id = ?',
+                                         (state, author, milestone, *key))
+                        indexed.append((tuple(key), labels, assignees))
+                    self._index(indexed, replace=False)
+                    self._db.execute('ANALYZE')
+                self._db.execute(f'PRAGMA user_version = {number}')
+
+    def _index(self, rows: list[tuple[tuple[str, int, int], set[str], set[str]]], replace: bool = True) -> None:
+        """
+        Write the label / assignee rows of stored items, given as (key, labels, assignees).
+        """
+        if replace:
+            keys = [key for key, _, _ in rows]
+            self._db.executemany('DELETE FROM item_labels WHERE item_type = ? AND project_id = ? AND id = ?', keys)
+            self._db.executemany('DELETE FROM item_assignees WHERE item_type = ? AND project_id = ? AND id = ?', keys)
+        self._db.executemany('INSERT INTO item_labels VALUES (?, ?, ?, ?)',
+                             [(*key, label) for key, labels, _ in rows for label in labels])
+        self._db.executemany('INSERT INTO item_assignees VALUES (?, ?, ?, ?)',
+                             [(*key, username) for key, _, assignees in rows for username in assignees])
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def upsert(self, item_type: str, items: list[dict], only_newer: bool = False, merge: bool = False) -> list[dict]:
+        """
+        Insert or replace items (as returned by the GitLab API). With only_newer,
+        a stored item is kept when its updated_at is more recent. With merge, the
+        items are partial: their fields are merged into the stored ones (see
+        _merge_item).
+
+        Returns:
+            The items as stored
+        """
+        query = ('INSERT INTO items (item_type, project_id, id, created_at, updated_at, data, state, author, '
+                 'milestone) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (item_type, project_id, id) DO UPDATE '
+                 'SET created_at = excluded.created_at, updated_at = excluded.updated_at, data = excluded.data, '
+                 'state = excluded.state, author = excluded.author, milestone = excluded.milestone')
+        if only_newer:
+            query += ' WHERE items.updated_at IS NULL OR excluded.updated_at >= items.updated_at'
+        with self._lock, self._db:
+            rows, indexed = [], []
+            for item in items:
+                key = (item_type, item.get('project_id') or 0, item['id'])
+                if merge:
+                    row = self._db.execute('SELECT data FROM items WHERE item_type = ? AND project_id = ? AND id = ?',
+                                           key).fetchone()
+                    item = _merge_item(json.loads(row[0]), item) if row else item
+                if not item.get('created_at'):
+                    raise ValueError(f"item {item['id']} has no created_at")
+                state, author, milestone, labels, assignees = _index_values(item)
+                rows.append((*key, item['created_at'], item.get('updated_at'), json.dumps(item),
+                             state, author, milestone))
+                indexed.append((key, labels, assignees, item))
+            if only_newer:
+                # label / assignee rows follow only the items actually written
+                indexed = [entry for row, entry in zip(rows, indexed) if self._db.execute(query, row).rowcount]
+            else:
+                self._db.executemany(query, rows)
+            self._index([(key, labels, assignees) for key, labels, assignees, _ in indexed])
+        return [item for _, _, _, item in indexed]
+
+    def items_page(self, item_type: str, year: int, after: tuple[str, int] | None = None,
+                   limit: int = 1000) -> list[dict]:
+        """
+        Up to `limit` items created in `year`, newest first (GitLab's default order).
+        `after` is the (created_at, id) of the last item of the previous page.
+        """
+        query = 'SELECT data FROM items WHERE item_type = ? AND created_at >= ? AND created_at < ?'
+        args = [item_type, f"{year}-", f"{year + 1}-"]
+        if after is not None:
+            query += ' AND (created_at < ? OR (created_at = ? AND id < ?))'
+            args += [after[0], after[0], after[1]]
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def search(self, item_type: str, year: int | None = None, author: str | None = None,
+               assignee: str | None = None, labels: list[str] | None = None, state: str | None = None,
+               project_id: int | None = None, milestone: str | None = None, sort: str = 'created_at',
+               order: str = 'desc', limit: int = 100) -> list[dict]:
+        """
+        Up to `limit` stored items matching every given filter, ordered by `sort`
+        ('created_at' or 'updated_at') then id. An item matches `labels` when it
+        has all of them; author and assignee are usernames, milestone a title.
+        """
+        if sort not in SORTS or order not in ('asc', 'desc'):
+            raise ValueError(f"sort must be one of: {', '.join(SORTS)}; order asc or desc")
+        query = 'SELECT data FROM items WHERE item_type = ?'
+        args = [item_type]
+        if year is not None:
+            query += ' AND created_at >= ? AND created_at < ?'
+            args += [f"{year}-", f"{year + 1}-"]
+        for column, value in (('author', author), ('state', state), ('project_id', project_id),
+                              ('milestone', milestone)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                args.append(value)
+        if assignee is not None:
+            query += (' AND EXISTS (SELECT 1 FROM item_assignees a WHERE a.item_type = items.item_type AND '
+                      'a.project_id = items.project_id AND a.id = items.id AND a.username = ?)')
+            args.append(assignee)
+        for label in dict.fromkeys(labels or ()):
+            query += (' AND EXISTS (SELECT 1 FROM item_labels l WHERE l.item_type = items.item_type AND '
+                      'l.project_id = items.project_id AND l.id = items.id AND l.label = ?)')
+            args.append(label)
+        query += f' ORDER BY {sort} {order}, id {order} LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self, item_type: str, year: int) -> int:
+        """
+        Number of items created in `year`.
+        """
+        with self._lock:
+            (count,) = self._db.execute(
+                'SELECT COUNT(*) FROM items WHERE item_type = ? AND created_at >= ? AND created_at < ?',
+                (item_type, f"{year}-", f"{year + 1}-")).fetchone()
+        return count
+
+    def is_loaded(self, item_type: str, year: int) -> bool:
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM loaded_years WHERE item_type = ? AND year = ?',
+                                   (item_type, year)).fetchone()
+        return row is not None
+
+    def mark_loaded(self, item_type: str, year: int) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR IGNORE INTO loaded_years VALUES (?, ?)', (item_type, year))
+
+    def last_sync(self, item_type: str) -> datetime | None:
+        with self._lock:
+            row = self._db.execute('SELECT last_sync FROM sync_state WHERE item_type = ?',
+                                   (item_type,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def set_last_sync(self, item_type: str, moment: datetime) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (item_type, moment.isoformat()))
+
+    def needs_refresh(self, item_type: str, max_age: float | None = None) -> bool:
+        """
+        Whether the last delta sync of `item_type` is older than `max_age` seconds
+        (default: the refresh interval).
+        """
+        max_age = self.refresh_interval if max_age is None else max_age
+        last_sync = self.last_sync(item_type)
+        return last_sync is None or (utcnow() - last_sync).total_seconds() >= max_age
+
+
+_UNSET = object()
+_default_store = _UNSET
+
+
+def get_default_store() -> ItemStore | None:
+    """
+    The store configured by GITLAB_STORE_PATH, opened on first use; None when unset.
+    """
+    global _default_store
+    if _default_store is _UNSET:
+        _default_store = ItemStore(GITLAB_STORE_PATH) if GITLAB_STORE_PATH else None
+    return _default_store
+
+
+def set_default_store(store: ItemStore | None) -> None:
+    """
+    Replace the default store (None disables it).
+    """
+    global _default_store
+    _default_store = store
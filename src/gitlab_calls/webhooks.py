@@ -0,0 +1,122 @@
+"""
+Ingestion of GitLab merge request / issue webhooks into the item store, so
+item queries stay current without polling GitLab.
+
+Events are authenticated with the X-Gitlab-Token header (GITLAB_WEBHOOK_SECRET)
+and their object is reshaped like the REST API items, then merged into the
+stored item (fields the hook lacks are kept) unless the stored copy is newer
+(webhooks may arrive out of order). Needs an item store (GITLAB_STORE_PATH).
+"""
+
+import hmac
+import os
+from datetime import datetime, timezone
+
+from .store import ItemStore, get_default_store
+
+# Secret token configured on the GitLab webhook; unset disables ingestion
+GITLAB_WEBHOOK_SECRET = os.getenv('GITLAB_WEBHOOK_SECRET', '')
+
+EVENTS = {
+    'Merge Request Hook': 'mr',
+    'Issue Hook': 'issues',
+    'Confidential Issue Hook': 'issues',
+}
+
+
+def verify_token(token: str | None, secret: str | None = None) -> bool:
+    """
+    Constant-time check of an X-Gitlab-Token header against the webhook secret.
+    """
+    secret = GITLAB_WEBHOOK_SECRET if secret is None else secret
+    return bool(secret) and token is not None and hmac.compare_digest(token.encode(), secret.encode())
+
+
+def _timestamp(value: str | None) -> str | None:
+    """
+    Webhook time ('2023-01-02 10:00:00 UTC' or ISO 8601) in the REST API format,
+    so stored items sort and filter alike.
+    """
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace(' UTC', '+00:00').replace('Z', '+00:00'))
+    moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+# REST field <- object_attributes field, copied when the hook carries it
+ATTRIBUTES = {
+    'id': 'id', 'iid': 'iid', 'title': 'title', 'description': 'description', 'state': 'state',
+    'web_url': 'url',
+}
+TIMES = ('created_at', 'updated_at', 'closed_at')
+MR_ATTRIBUTES = {'source_branch': 'source_branch', 'target_branch': 'target_branch'}
+
+
+def item_from_event(payload: dict) -> dict:
+    """
+    REST-shaped merge request / issue of a webhook payload, with only the fields
+    the hook carries (merged into the stored item by ingest_event). The author
+    and milestone are objects with at least their id: username / title are
+    added only when the payload has them.
+    """
+    attributes = payload['object_attributes']
+    kind_attributes = {**ATTRIBUTES, **MR_ATTRIBUTES} if payload.get('object_kind') == 'merge_request' else ATTRIBUTES
+    item = {name: attributes[field] for name, field in kind_attributes.items() if field in attributes}
+    item.update((name, _timestamp(attributes[name])) for name in TIMES if name in attributes)
+    if payload.get('object_kind') == 'merge_request':
+        if 'merged_at' in attributes:
+            item['merged_at'] = _timestamp(attributes['merged_at'])
+        if 'draft' in attributes or 'work_in_progress' in attributes:
+            item['draft'] = attributes.get('draft', attributes.get('work_in_progress'))
+
+    project_id = (attributes.get('target_project_id') or attributes.get('project_id')
+                  or (payload.get('project') or {}).get('id'))
+    if project_id:
+        item['project_id'] = project_id
+
+    if 'author_id' in attributes:
+        item['author'] = {'id': attributes['author_id']}
+        user = payload.get('user') or {}
+        if user.get('id') is not None and user.get('id') == attributes['author_id']:
+            item['author'].update(username=user.get('username'), name=user.get('name'))
+    if 'milestone_id' in attributes:
+        item['milestone'] = {'id': attributes['milestone_id']} if attributes['milestone_id'] else None
+    if 'assignees' in payload:
+        item['assignees'] = [
+            {'id': assignee.get('id'), 'username': assignee.get('username'), 'name': assignee.get('name')}
+            for assignee in payload['assignees'] or ()
+        ]
+    if 'labels' in payload:
+        item['labels'] = [label['title'] for label in payload['labels'] or () if 'title' in label]
+    return item
+
+
+def ingest_event(event: str, payload: dict, store: ItemStore | None = None) -> tuple[str, dict] | None:
+    """
+    Upsert the merge request or issue of a webhook into the item store: a stored
+    item is updated with the fields the hook carries, the others are kept.
+
+    Args:
+        event: X-Gitlab-Event header
+        payload: Webhook JSON body
+        store: Item store (default: the one configured by GITLAB_STORE_PATH)
+
+    Returns:
+        (item_type, item as stored), None for events other than merge request / issue ones
+
+    Raises:
+        ValueError: If the payload has no object_attributes, no created_at for a new
+            item, or no item store is configured
+    """
+    item_type = EVENTS.get(event)
+    if item_type is None:
+        return None
+    if not isinstance(payload.get('object_attributes'), dict) or 'id' not in payload['object_attributes']:
+        raise ValueError("webhook payload has no object_attributes")
+    store = store or get_default_store()
+    if store is None:
+        raise ValueError("No item store configured (set GITLAB_STORE_PATH)")
+    item = item_from_event(payload)
+    stored = store.upsert(item_type, [item], only_newer=True, merge=True)
+    return item_type, stored[0] if stored else item
@@ -0,0 +1,75 @@
+"""
+Instrumentation of the API routes:
+  - latency histogram / request counter per route (Prometheus, see gitlab_calls.metrics)
+  - one log line per request with the GitLab requests, pages and bytes it cost
+    (logger gitlab_calls.requests, set up by configure_logging)
+"""
+
+import logging
+import os
+import time
+
+from starlette.responses import Response
+
+from gitlab_calls import metrics
+
+
+# Level of the gitlab_calls loggers (per-request cost lines are INFO)
+GITLAB_CALLS_LOG_LEVEL = os.getenv('GITLAB_CALLS_LOG_LEVEL', 'INFO')
+
+
+def configure_logging(level: str = GITLAB_CALLS_LOG_LEVEL) -> None:
+    """
+    Give the gitlab_calls loggers a level and a stderr handler: neither the app
+    nor uvicorn's default logging config sets them up.
+    """
+    logger = logging.getLogger('gitlab_calls')
+    logger.setLevel(level.upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request up to the end of its response
+    body (streamed responses included), labelled by route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = metrics.track_request()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_observed(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            route = scope.get('route')
+            metrics.observe_route(route.path if route is not None else 'unmatched', scope['method'], status,
+                                  time.perf_counter() - started, stats)
+
+
+def metrics_response() -> Response:
+    """
+    Prometheus exposition of the process metrics, 501 without prometheus_client.
+    """
+    exposition = metrics.exposition()
+    if exposition is None:
+        return Response("prometheus_client is not installed\n", status_code=501, media_type="text/plain")
+    body, content_type = exposition
+    return Response(body, media_type=content_type)
@@ -182,6 +182,40 @@ class TestGrantRoleEndpoint:
         assert response.headers["content-type"] == "application/json"
 
 
+class TestGrantRolesEndpoint:
+    """Test /grant-roles endpoint"""
+
+    def test_grant_roles_reports_per_item_results(self):
+        """Test batch grant returns one result per grant"""
+        payload = {
+            "grants": [
+                {"username": "testuser", "repo_or_group": "testgroup/testproject", "role": "developer"},
+                {"username": "testuser", "repo_or_group": "testgroup", "role": "invalid_role"}
+            ]
+        }
+
+        response = requests.post(
+            f"{BASE_URL}/grant-roles",
+            json=payload
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 2
+        assert len(data["results"]) == 2
+        assert data["results"][1]["success"] == False
+        assert "Invalid role" in data["results"][1]["error"]
+
+    def test_grant_roles_invalid_payload(self):
+        """Test batch grant without a list of grants"""
+        response = requests.post(
+            f"{BASE_URL}/grant-roles",
+            json={"grants": "testuser"}
+        )
+
+        assert response.status_code == 400
+
+
 class TestGetItemsEndpoint:
     """Test /get-items endpoint"""
     
@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+# Import module to test (run with PYTHONPATH=src)
+import fast_responses
+from fast_responses import CompressionMiddleware, compressible, negotiate_encoding
+
+zstandard = fast_responses.zstandard
+needs_zstd = pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")
+
+
+def body_app(chunks, headers=None):
+    """ASGI app answering with `chunks` as successive body messages"""
+    async def app(scope, receive, send):
+        raw = [(name.encode(), value.encode())
+               for name, value in {'content-type': 'application/json', **(headers or {})}.items()]
+        if len(chunks) == 1:
+            raw.append((b'content-length', str(len(chunks[0])).encode()))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': raw})
+        for index, chunk in enumerate(chunks):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': index < len(chunks) - 1})
+    return app
+
+
+def call(app, accept_encoding=None, minimum_size=100):
+    """Run a request through CompressionMiddleware; returns (headers, body messages)"""
+    headers = [(b'accept-encoding', accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    start, *bodies = sent
+    return {name.decode(): value.decode() for name, value in start['headers']}, bodies
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('gzip', 'gzip'),
+    pytest.param('gzip, zstd', 'zstd', marks=needs_zstd),
+    ('zstd;q=0, gzip;q=0.5', 'gzip'),
+    pytest.param('*', 'zstd', marks=needs_zstd),
+    ('*, zstd;q=0', 'gzip'),
+    ('br, identity', None),
+    ('gzip;q=0', None),
+    ('', None),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_negotiate_encoding_without_zstandard(monkeypatch):
+    monkeypatch.setattr(fast_responses, 'zstandard', None)
+    assert negotiate_encoding('zstd, gzip;q=0.1') == 'gzip'
+    assert negotiate_encoding('zstd') is None
+
+
+@pytest.mark.parametrize("coding, decode", [
+    ('gzip', gzip.decompress),
+    pytest.param('zstd', lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+                 marks=needs_zstd),
+])
+def test_compresses_a_large_body(coding, decode):
+    body = b'{"items":[' + b','.join(b'{"id":%d}' % n for n in range(500)) + b']}'
+    headers, bodies = call(body_app([body]), coding)
+
+    assert headers['content-encoding'] == coding
+    assert headers['vary'] == 'Accept-Encoding'
+    assert len(bodies) == 1 and not bodies[0]['more_body']
+    assert headers['content-length'] == str(len(bodies[0]['body'])) and len(bodies[0]['body']) < len(body)
+    assert decode(bodies[0]['body']) == body
+
+
+def test_small_or_encoded_bodies_pass_through():
+    headers, bodies = call(body_app([b'{"ok":true}']), 'gzip')
+    assert 'content-encoding' not in headers and 'vary' not in headers
+    assert headers['content-length'] == '11' and bodies[0]['body'] == b'{"ok":true}'
+
+    encoded = gzip.compress(b'x' * 1000)
+    headers, bodies = call(body_app([encoded], {'content-encoding': 'gzip'}), 'gzip, zstd')
+    assert headers['content-encoding'] == 'gzip' and bodies[0]['body'] == encoded
+
+    headers, bodies = call(body_app([b'x' * 1000]), None)
+    assert 'content-encoding' not in headers and bodies[0]['body'] == b'x' * 1000
+
+    parquet = b'PAR1' + bytes(range(256)) * 4
+    headers, bodies = call(body_app([parquet], {'content-type': 'application/vnd.apache.parquet'}), 'gzip')
+    assert 'content-encoding' not in headers and bodies[0]['body'] == parquet
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ('application/json', True),
+    ('application/x-ndjson', True),
+    ('text/csv; charset=utf-8', True),
+    ('application/vnd.apache.parquet', False),
+    ('application/vnd.apache.arrow.stream', False),
+    ('', False),
+])
+def test_compressible(content_type, expected):
+    assert compressible(content_type) == expected
+
+
+def test_streamed_body_is_flushed_chunk_by_chunk():
+    lines = [b'{"id":%d}\n' % n for n in range(5)]
+    headers, bodies = call(body_app(lines), 'gzip')
+
+    assert headers['content-encoding'] == 'gzip' and 'content-length' not in headers
+    assert [message['more_body'] for message in bodies] == [True] * 4 + [False]
+    # every chunk is sync-flushed: the lines received so far decode without the rest of the stream
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for line, message in zip(lines, bodies):
+        assert decompressor.decompress(message['body']) == line
+    assert decompressor.eof
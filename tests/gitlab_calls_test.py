@@ -1,24 +1,47 @@
 # python
+import asyncio
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import httpx
 import pytest
-import requests
-from types import SimpleNamespace
 
 # Import function to test using relative import (package parent has __init__.py)
-from gitlab_calls import grant_user_role
+import gitlab_calls
+from gitlab_calls import grant_user_role, get_items_by_year, get_items_by_year_async
+
+
+def MockResponse(json_data=None, status_code=200, headers=None):
+    return httpx.Response(
+        status_code,
+        json=json_data if json_data is not None else {},
+        headers=headers or {}
+    )
 
 
-class MockResponse:
-    def __init__(self, json_data=None, status_code=200, headers=None):
-        self._json = json_data if json_data is not None else {}
-        self.status_code = status_code
-        self.headers = headers or {}
+def install(get=None, put=None, post=None):
+    """Route GitLab calls to fake handlers: get(url, params), put/post(url, json)"""
+    def handler(request: httpx.Request):
+        url = str(request.url.copy_with(query=None))
+        match request.method:
+            case 'GET':
+                return get(url, params=dict(request.url.params))
+            case 'PUT':
+                return put(url, json=json.loads(request.content))
+            case 'POST':
+                return post(url, json=json.loads(request.content))
+        raise AssertionError(f"unexpected {request.method} {url}")
 
-    def json(self):
-        return self._json
+    gitlab_calls.set_transport(httpx.MockTransport(handler))
 
-    def raise_for_status(self):
-        if self.status_code >= 400:
-            raise requests.HTTPError(f"{self.status_code} Error")
+
+@pytest.fixture(autouse=True)
+def reset_transport():
+    yield
+    gitlab_calls.set_transport(None)
+    gitlab_calls.invalidate_resolver_cache()
 
 
 def test_invalid_role_raises_value_error():
@@ -26,14 +49,14 @@ def test_invalid_role_raises_value_error():
         grant_user_role('someuser', 'some/group', 'not_a_role')
 
 
-def test_user_not_found_raises_exception(monkeypatch):
-    def fake_get(url, headers=None, params=None):
+def test_user_not_found_raises_exception():
+    def fake_get(url, params=None):
         # Simulate users endpoint returning empty list
         if '/api/v4/users' in url:
             return MockResponse(json_data=[], status_code=200)
         return MockResponse(json_data={}, status_code=200)
 
-    monkeypatch.setattr(requests, 'get', fake_get)
+    install(get=fake_get)
 
     with pytest.raises(Exception) as exc:
         grant_user_role('no_user', 'some/group', 'developer')
@@ -41,9 +64,9 @@ def test_user_not_found_raises_exception(monkeypatch):
     assert "no_user" in str(exc.value)
 
 
-def test_project_update_existing_member(monkeypatch):
+def test_project_update_existing_member():
     # Prepare responses for the sequence of requests
-    def fake_get(url, headers=None, params=None):
+    def fake_get(url, params=None):
         if '/api/v4/users' in url:
             return MockResponse(json_data=[{'id': 1}], status_code=200)
         if '/api/v4/projects/' in url:
@@ -51,47 +74,1101 @@ def test_project_update_existing_member(monkeypatch):
             return MockResponse(json_data={'id': 2}, status_code=200)
         return MockResponse(json_data={}, status_code=200)
 
-    def fake_put(url, headers=None, json=None):
+    def fake_put(url, json=None):
         # Simulate updating existing member successfully
         if '/api/v4/projects/2/members/1' in url:
             return MockResponse(json_data={'member': 'updated'}, status_code=200)
         return MockResponse(json_data={}, status_code=200)
 
-    def fake_post(url, headers=None, json=None):
+    def fake_post(url, json=None):
         # Should not be called in this scenario, but return a default success
         return MockResponse(json_data={'member': 'created'}, status_code=201)
 
-    monkeypatch.setattr(requests, 'get', fake_get)
-    monkeypatch.setattr(requests, 'put', fake_put)
-    monkeypatch.setattr(requests, 'post', fake_post)
+    install(get=fake_get, put=fake_put, post=fake_post)
 
     result = grant_user_role('user1', 'group/repo', 'developer')
     assert result == {'member': 'updated'}
 
 
-def test_project_add_member_on_404(monkeypatch):
+def test_project_add_member_on_404():
     # Prepare responses for the sequence of requests
-    def fake_get(url, headers=None, params=None):
+    def fake_get(url, params=None):
         if '/api/v4/users' in url:
             return MockResponse(json_data=[{'id': 10}], status_code=200)
         if '/api/v4/projects/' in url:
             return MockResponse(json_data={'id': 20}, status_code=200)
         return MockResponse(json_data={}, status_code=200)
 
-    def fake_put(url, headers=None, json=None):
+    def fake_put(url, json=None):
         # Simulate member not found => 404
         if '/api/v4/projects/20/members/10' in url:
             return MockResponse(json_data={'message': 'Not Found'}, status_code=404)
         return MockResponse(json_data={}, status_code=200)
 
-    def fake_post(url, headers=None, json=None):
+    def fake_post(url, json=None):
         if '/api/v4/projects/20/members' in url:
             return MockResponse(json_data={'member': 'created'}, status_code=201)
         return MockResponse(json_data={}, status_code=200)
 
-    monkeypatch.setattr(requests, 'get', fake_get)
-    monkeypatch.setattr(requests, 'put', fake_put)
-    monkeypatch.setattr(requests, 'post', fake_post)
+    install(get=fake_get, put=fake_put, post=fake_post)
 
     result = grant_user_role('user10', 'group/repo', 'maintainer')
-    assert result == {'member': 'created'}
\ No newline at end of file
+    assert result == {'member': 'created'}
+
+
+def test_group_add_member_on_404():
+    def fake_get(url, params=None):
+        if '/api/v4/users' in url:
+            return MockResponse(json_data=[{'id': 3}])
+        if '/api/v4/groups/mygroup' in url:
+            return MockResponse(json_data={'id': 4})
+        return MockResponse(json_data={}, status_code=404)
+
+    def fake_put(url, json=None):
+        return MockResponse(json_data={'message': 'Not Found'}, status_code=404)
+
+    def fake_post(url, json=None):
+        assert url.endswith('/api/v4/groups/4/members')
+        assert json == {'user_id': 3, 'access_level': 40}
+        return MockResponse(json_data={'member': 'created'}, status_code=201)
+
+    install(get=fake_get, put=fake_put, post=fake_post)
+
+    assert grant_user_role('user3', 'mygroup', 'maintainer') == {'member': 'created'}
+
+
+def test_repeated_grants_hit_resolver_cache():
+    calls = []
+
+    def fake_get(url, params=None):
+        calls.append(('GET', url))
+        if '/api/v4/users' in url:
+            return MockResponse(json_data=[{'id': 5}])
+        return MockResponse(json_data={'id': 6})
+
+    def fake_put(url, json=None):
+        calls.append(('PUT', url))
+        return MockResponse(json_data={'access_level': json['access_level']})
+
+    install(get=fake_get, put=fake_put)
+    before = gitlab_calls.resolver_cache_stats()
+
+    for role in ['guest', 'reporter', 'developer']:
+        grant_user_role('user5', 'group/repo', role)
+
+    assert [method for method, _ in calls] == ['GET', 'GET', 'PUT', 'PUT', 'PUT']
+    stats = gitlab_calls.resolver_cache_stats()
+    assert stats['hits'] - before['hits'] == 4
+    assert stats['misses'] - before['misses'] == 2
+
+    gitlab_calls.invalidate_resolver_cache(repo_or_group='group/repo')
+    grant_user_role('user5', 'group/repo', 'guest')
+    assert [method for method, _ in calls[5:]] == ['GET', 'PUT']
+
+
+def test_batch_grants_resolve_once_and_report_per_item():
+    calls = []
+
+    def fake_get(url, params=None):
+        calls.append(url)
+        if '/api/v4/users' in url:
+            if params['username'] == 'ghost':
+                return MockResponse(json_data=[])
+            return MockResponse(json_data=[{'id': int(params['username'][-1])}])
+        return MockResponse(json_data={'id': 100 + len(url) % 7})
+
+    def fake_put(url, json=None):
+        if '/members/2' in url:
+            return MockResponse(json_data={'message': 'Not Found'}, status_code=404)
+        return MockResponse(json_data={'access_level': json['access_level']})
+
+    def fake_post(url, json=None):
+        return MockResponse(json_data={'user_id': json['user_id'], 'access_level': json['access_level']}, status_code=201)
+
+    install(get=fake_get, put=fake_put, post=fake_post)
+
+    grants = [
+        {'username': f'user{n % 3}', 'repo_or_group': repo, 'role': 'developer'}
+        for n in range(3) for repo in ['g/a', 'g/b', 'g']
+    ] + [
+        {'username': 'ghost', 'repo_or_group': 'g/a', 'role': 'guest'},
+        {'username': 'user1', 'repo_or_group': 'g/a', 'role': 'boss'},
+        {'username': ['user1'], 'repo_or_group': 'g/a', 'role': 'guest'},
+    ]
+    results = gitlab_calls.grant_user_roles(grants, concurrency=4)
+
+    assert [result['success'] for result in results] == [True] * 9 + [False, False, False]
+    assert results[3]['data'] == {'access_level': 30}
+    assert results[6]['data'] == {'user_id': 2, 'access_level': 30}
+    assert "ghost" in results[9]['error']
+    assert "Invalid role" in results[10]['error']
+    assert "must be strings" in results[11]['error']
+    # 4 distinct users (incl. ghost) + 3 distinct targets, each looked up once
+    assert len(calls) == 7
+
+
+@pytest.mark.parametrize("concurrency", ['x', 0, -1, 2.5, True])
+def test_batch_calls_reject_invalid_concurrency(concurrency):
+    install(get=lambda url, params=None: pytest.fail("unexpected upstream call"))
+    grant = {'username': 'jdoe', 'repo_or_group': 'group/project', 'role': 'developer'}
+    with pytest.raises(ValueError, match="concurrency"):
+        gitlab_calls.grant_user_roles([grant], concurrency=concurrency)
+    with pytest.raises(ValueError, match="concurrency"):
+        gitlab_calls.reconcile_memberships([grant], concurrency=concurrency)
+    with pytest.raises(ValueError, match="concurrency"):
+        gitlab_calls.grant_group_projects('jdoe', 'group', 'developer', concurrency=concurrency)
+
+
+def test_ttl_cache_expiry_and_lru_eviction(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(gitlab_calls.cache.time, 'monotonic', lambda: now[0])
+    cache = gitlab_calls.TTLCache(maxsize=2, ttl=10)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    now[0] += 11
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 1
+    # the expired 'c', never read again, is swept by the next set
+    cache.set('d', 4)
+    assert cache.stats()['size'] == 1
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(gitlab_calls.gitlab_calls, 'GITLAB_BACKOFF_BASE', 0.001)
+
+
+def test_throttled_and_failing_reads_are_retried(fast_backoff):
+    statuses = [429, 503, 200]
+
+    def fake_get(url, params=None):
+        status = statuses.pop(0)
+        return MockResponse(json_data=[{'id': 1}] if status == 200 else {}, status_code=status,
+                            headers={'retry-after': '0', 'x-page': '1'})
+
+    install(get=fake_get)
+
+    assert get_items_by_year('mr', 2023, pagination='offset') == [{'id': 1}]
+    assert statuses == []
+
+
+def test_failing_member_add_is_not_retried(fast_backoff):
+    posts = []
+
+    def fake_post(url, json=None):
+        posts.append(url)
+        return MockResponse(json_data={}, status_code=502)
+
+    install(get=lambda url, params=None: MockResponse(json_data=[{'id': 1}] if 'users' in url else {'id': 2}),
+            put=lambda url, json=None: MockResponse(status_code=404),
+            post=fake_post)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        grant_user_role('user1', 'group/repo', 'guest')
+    assert len(posts) == 1
+
+
+def test_scheduler_adapts_to_rate_limit_headers():
+    async def main():
+        scheduler = gitlab_calls.RequestScheduler(max_concurrency=8)
+        reset = str(int(time.time()) + 10)
+
+        scheduler._observe(httpx.Response(200, headers={'ratelimit-limit': '600', 'ratelimit-remaining': '500',
+                                                        'ratelimit-reset': reset}))
+        assert scheduler.interval == 0
+
+        # budget running low: spread the 5 remaining requests over the reset window
+        scheduler._observe(httpx.Response(200, headers={'ratelimit-limit': '600', 'ratelimit-remaining': '5',
+                                                        'ratelimit-reset': reset}))
+        assert 1 < scheduler.interval <= 2
+
+        scheduler._observe(httpx.Response(429, headers={'retry-after': '3'}))
+        assert scheduler.stats()['limit'] == 4
+        assert scheduler.stats()['throttled'] == 1
+
+    asyncio.run(main())
+
+
+def test_scheduler_halves_once_per_window():
+    async def main():
+        scheduler = gitlab_calls.RequestScheduler(max_concurrency=16)
+        scheduler.requests = 3
+        # a burst of 429s for requests admitted together halves the limit once
+        for admitted in (1, 2, 3):
+            scheduler._observe(httpx.Response(429), admitted)
+        assert scheduler.stats()['limit'] == 8 and scheduler.stats()['throttled'] == 3
+
+        # a request admitted after the decrease is throttled again: halve again
+        scheduler.requests = 4
+        scheduler._observe(httpx.Response(429), 4)
+        assert scheduler.stats()['limit'] == 4
+
+    asyncio.run(main())
+
+
+def test_retry_after_uses_rate_limit_reset_only_when_throttled():
+    reset = str(int(time.time()) + 10)
+    assert 8 < gitlab_calls.scheduler.retry_after(httpx.Response(429, headers={'ratelimit-reset': reset})) <= 10
+    assert 8 < gitlab_calls.scheduler.retry_after(httpx.Response(200, headers={'ratelimit-remaining': '0',
+                                                                     'ratelimit-reset': reset})) <= 10
+    # a 5xx or a request with budget left is not paused until the reset
+    assert gitlab_calls.scheduler.retry_after(httpx.Response(503, headers={'ratelimit-remaining': '40',
+                                                                 'ratelimit-reset': reset})) is None
+    assert gitlab_calls.scheduler.retry_after(httpx.Response(503, headers={'retry-after': '2',
+                                                                 'ratelimit-reset': reset})) == 2
+
+
+def test_get_responses_revalidated_with_etag():
+    conditional = []
+
+    def handler(request):
+        conditional.append(request.headers.get('if-none-match'))
+        if request.headers.get('if-none-match') == 'W/"v1"':
+            return httpx.Response(304, headers={'etag': 'W/"v1"'})
+        return MockResponse(json_data={'id': 7}, headers={'etag': 'W/"v1"'})
+
+    gitlab_calls.set_transport(httpx.MockTransport(handler))
+    hits = gitlab_calls.response_cache.stats()['hits']
+
+    async def lookup():
+        return (await gitlab_calls.gitlab_calls._request('GET', f"{gitlab_calls.GITLAB_URL}/api/v4/groups/g")).json()
+
+    assert asyncio.run(lookup()) == {'id': 7}
+    assert asyncio.run(lookup()) == {'id': 7}
+    assert conditional == [None, 'W/"v1"']
+    assert gitlab_calls.response_cache.stats()['hits'] == hits + 1
+
+
+def test_response_cache_is_bounded_by_size():
+    cache = gitlab_calls.ResponseCache(max_bytes=10)
+    cache.set('a', 'e1', {}, b'12345')
+    cache.set('b', 'e2', {}, b'12345')
+    cache.get('a')
+    cache.set('c', 'e3', {}, b'123')   # evicts 'b', the least recently used
+    cache.set('d', 'e4', {}, b'x' * 11)  # larger than the cache, not stored
+
+    assert cache.get('b') is None and cache.get('d') is None
+    assert cache.get('a')[2] == b'12345'
+    assert cache.stats()['bytes'] == 8
+
+
+def test_single_flight_shares_concurrent_calls():
+    calls = 0
+
+    async def crawl():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [calls]
+
+    async def main():
+        flight = gitlab_calls.SingleFlight(ttl=60, maxsize=8)
+        burst = await asyncio.gather(*(flight.do(('mr', 2023), crawl) for _ in range(10)))
+        follow_up = await flight.do(('mr', 2023), crawl)
+        other = await flight.do(('mr', 2024), crawl)
+        return burst, follow_up, other, flight.stats()
+
+    burst, follow_up, other, stats = asyncio.run(main())
+
+    assert burst == [[1]] * 10
+    assert follow_up == [1]
+    assert other == [2]
+    assert stats['calls'] == 2 and stats['shared'] == 9
+
+
+def test_single_flight_results_expire_and_are_bounded_by_items():
+    async def main():
+        flight = gitlab_calls.SingleFlight(ttl=0.05, max_weight=10)
+        for key in range(3):
+            await flight.do(key, lambda: asyncio.sleep(0, result=[0] * 4))
+        # 12 items: the oldest result was dropped; a result above the cap isn't kept
+        kept = flight.stats()['cached']['entries'], flight.weight
+        await flight.do('big', lambda: asyncio.sleep(0, result=[0] * 11))
+        assert 'big' not in flight._results
+        # expired results are dropped without being read again
+        await asyncio.sleep(0.1)
+        return kept, flight.stats()['cached']
+
+    kept, cached = asyncio.run(main())
+    assert kept == (2, 8)
+    assert cached['entries'] == 0 and cached['weight'] == 0
+
+
+def test_single_flight_does_not_cache_failures():
+    async def main():
+        flight = gitlab_calls.SingleFlight(ttl=60, maxsize=8)
+        attempts = []
+
+        async def crawl():
+            attempts.append(1)
+            raise ValueError("boom")
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await flight.do('key', crawl)
+        return len(attempts)
+
+    assert asyncio.run(main()) == 2
+
+
+def fake_pages(pages, totals=False, requested=None):
+    """Serve `pages` (list of item lists) with GitLab offset pagination headers"""
+    def fake_get(url, params=None):
+        page = int(params.get('page', 1))
+        if requested is not None and 'pagination' not in params:
+            requested.append(page)
+        items = pages[page - 1] if page <= len(pages) else []
+        headers = {'x-page': str(page)}
+        headers['x-next-page'] = str(page + 1) if page < len(pages) else ''
+        if totals:
+            headers['x-total-pages'] = str(len(pages))
+            headers['x-total'] = str(sum(map(len, pages)))
+        return MockResponse(json_data=items, headers=headers)
+    return fake_get
+
+
+def test_get_items_follows_next_page():
+    install(get=fake_pages([[{'id': 1}, {'id': 2}], [{'id': 3}]]))
+
+    assert get_items_by_year('mr', 2023) == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+
+def test_get_items_fans_out_pages_in_order():
+    pages = [[{'id': n}] for n in range(1, 21)]
+    requested = []
+    install(get=fake_pages(pages, totals=True, requested=requested))
+
+    assert get_items_by_year('mr', 2023, concurrency=4) == [{'id': n} for n in range(1, 21)]
+    assert sorted(requested) == list(range(1, 21))
+
+
+def test_get_items_fan_out_respects_concurrency():
+    in_flight = peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        page = int(request.url.params.get('page', 1))
+        # later pages answer first, results must still come back in page order
+        await asyncio.sleep(0.001 * (30 - page))
+        in_flight -= 1
+        return MockResponse(json_data=[{'id': page}], headers={'x-page': str(page), 'x-total-pages': '30'})
+
+    gitlab_calls.set_transport(httpx.MockTransport(handler))
+
+    assert get_items_by_year('issues', 2023, concurrency=5) == [{'id': n} for n in range(1, 31)]
+    assert peak <= 5
+
+
+def fake_listing(items, totals_cap=None, requested=None):
+    """Serve items filtered by created_after/created_before, newest first, like GitLab"""
+    def fake_get(url, params=None):
+        if requested is not None and 'pagination' not in params:
+            requested.append(params)
+        window = [item for item in items
+                  if params.get('created_after', '') <= item['created_at'] <= params.get('created_before', '~')]
+        window.sort(key=lambda item: (item['created_at'], item['id']), reverse=True)
+        page, per_page = int(params.get('page', 1)), int(params['per_page'])
+        headers = {'x-page': str(page), 'x-next-page': str(page + 1) if page * per_page < len(window) else ''}
+        if totals_cap is None or len(window) <= totals_cap:
+            headers['x-total'] = str(len(window))
+        return MockResponse(json_data=window[(page - 1) * per_page:page * per_page], headers=headers)
+    return fake_get
+
+
+def year_items(count, year=2023):
+    start = datetime(year, 1, 1)
+    step = timedelta(days=365) / count
+    return [{'id': n, 'created_at': (start + step * n).strftime('%Y-%m-%dT%H:%M:%SZ')} for n in range(count)]
+
+
+@pytest.mark.parametrize("shard", ['month', 'week'])
+def test_get_items_sharded_matches_serial_order(shard):
+    items = year_items(1000)
+    install(get=fake_listing(items))
+
+    serial = get_items_by_year('mr', 2023)
+    sharded = get_items_by_year('mr', 2023, shard=shard)
+
+    assert len(serial) == 1000
+    assert sharded == serial
+
+
+def test_get_items_sharded_deduplicates_boundary_items():
+    # created exactly on a month boundary: returned by both adjacent windows
+    items = [{'id': 1, 'created_at': '2023-02-01T00:00:00Z'}, {'id': 2, 'created_at': '2023-01-15T00:00:00Z'}]
+    install(get=fake_listing(items))
+
+    assert get_items_by_year('issues', 2023, shard='month') == [items[0], items[1]]
+
+
+def test_get_items_auto_shard_bisects_uncounted_windows(monkeypatch):
+    monkeypatch.setattr(gitlab_calls.gitlab_calls, 'SHARD_MAX_ITEMS', 300)
+    items = year_items(2000)
+    requested = []
+    # like GitLab above 10k rows: no totals for windows with more than 300 items
+    install(get=fake_listing(items, totals_cap=300, requested=requested))
+
+    result = get_items_by_year('mr', 2023, shard='auto')
+
+    assert [item['id'] for item in result] == list(reversed(range(2000)))
+    assert len({params['created_after'] for params in requested}) > 4
+
+
+
+def test_count_items_reads_x_total():
+    requested = []
+    install(get=fake_listing(year_items(500), requested=requested))
+
+    assert gitlab_calls.count_items_by_year('mr', 2023) == 500
+    assert [params['per_page'] for params in requested] == ['1']
+
+
+def test_count_items_bisects_uncounted_windows():
+    items = year_items(2000)
+    # an item on every bisection boundary must be counted once
+    items.append({'id': 2000, 'created_at': '2023-07-02T11:59:59Z'})
+    install(get=fake_listing(items, totals_cap=300))
+
+    assert gitlab_calls.count_items_by_year('issues', 2023) == 2001
+
+def fake_keyset_listing(items, requested):
+    """Serve items by id desc with keyset pagination, offset pagination otherwise"""
+    offset = fake_listing(items)
+
+    def fake_get(url, params=None):
+        if params.get('pagination') != 'keyset':
+            return offset(url, params)
+        requested.append(params)
+        window = sorted((item for item in items
+                         if params['created_after'] <= item['created_at'] <= params['created_before']),
+                        key=lambda item: item['id'], reverse=True) if 'created_after' in params else items
+        if 'id_before' in params:
+            window = [item for item in window if item['id'] < int(params['id_before'])]
+        per_page = int(params['per_page'])
+        page = window[:per_page]
+        headers = {}
+        if len(window) > per_page:
+            query = {**params, 'id_before': page[-1]['id']}
+            headers['link'] = f'<{url}?{"&".join(f"{k}={v}" for k, v in query.items())}>; rel="next"'
+        return MockResponse(json_data=page, headers=headers)
+    return fake_get
+
+
+def test_get_items_auto_selects_keyset_when_supported():
+    items = year_items(450)
+    requested = []
+    install(get=fake_keyset_listing(items, requested))
+
+    result = get_items_by_year('mr', 2023)
+
+    assert [item['id'] for item in result] == list(reversed(range(450)))
+    # probe + 5 pages following the Link header, no offset page requested
+    assert len(requested) == 6
+    assert all('page' not in params for params in requested)
+
+
+def test_get_items_keyset_with_auto_shard(monkeypatch):
+    monkeypatch.setattr(gitlab_calls.gitlab_calls, 'SHARD_MAX_ITEMS', 300)
+    items = year_items(1000)
+    install(get=fake_keyset_listing(items, []))
+
+    result = get_items_by_year('issues', 2023, shard='auto', pagination='keyset')
+
+    assert sorted(item['id'] for item in result) == list(range(1000))
+
+
+@pytest.mark.parametrize("status", [405, 400])
+def test_get_items_auto_falls_back_to_offset(status):
+    calls = []
+
+    def fake_get(url, params=None):
+        if params.get('pagination') == 'keyset':
+            calls.append('probe')
+            return MockResponse(json_data={'message': 'not supported'}, status_code=status)
+        calls.append(params['page'])
+        return MockResponse(json_data=[{'id': 1}], headers={'x-page': '1', 'x-total-pages': '1'})
+
+    install(get=fake_get)
+
+    assert get_items_by_year('mr', 2023) == [{'id': 1}]
+    assert get_items_by_year('mr', 2022) == [{'id': 1}]
+    # probed once per endpoint
+    assert calls == ['probe', '1', '1']
+
+
+def test_keyset_probe_errors_are_not_cached():
+    statuses = [403, 200]
+    calls = []
+
+    def fake_get(url, params=None):
+        if params.get('pagination') == 'keyset' and params.get('per_page') == '1':
+            calls.append('probe')
+            status = statuses.pop(0)
+            return MockResponse(json_data=[] if status == 200 else {'message': 'forbidden'}, status_code=status)
+        calls.append('page')
+        return MockResponse(json_data=[{'id': 1}])
+
+    install(get=fake_get)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        get_items_by_year('mr', 2023)
+    # the failed probe isn't taken as "keyset unsupported": the next query probes again
+    assert get_items_by_year('mr', 2023) == [{'id': 1}]
+    assert calls == ['probe', 'probe', 'page']
+
+
+def test_iter_items_is_lazy():
+    pages = [[{'id': n * 10 + i} for i in range(3)] for n in range(1, 11)]
+    requested = []
+    install(get=fake_pages(pages, requested=requested))
+
+    items = gitlab_calls.iter_items_by_year('mr', 2023, concurrency=1)
+    assert [next(items) for _ in range(4)] == pages[0] + pages[1][:1]
+    items.close()
+
+    # serial walk: only the pages needed so far (plus bounded read-ahead) were fetched
+    assert requested[:2] == [1, 2]
+    assert len(requested) <= 4
+
+
+def test_iter_items_async_streams_sharded_windows():
+    items = year_items(500)
+    install(get=fake_listing(items))
+
+    async def main():
+        return [item async for item in gitlab_calls.iter_items_by_year_async('issues', 2023, shard='week')]
+
+    assert asyncio.run(main()) == get_items_by_year('issues', 2023)
+
+
+def test_get_items_field_projection():
+    item = {
+        'id': 1, 'iid': 7, 'project_id': 3, 'title': 't', 'description': 'long text',
+        'author': {'id': 9, 'username': 'jdoe', 'avatar_url': 'http://x'},
+        'assignees': [{'id': 9, 'username': 'jdoe'}, {'id': 8, 'username': 'ann'}],
+        'time_stats': {'time_estimate': 0},
+    }
+    install(get=fake_pages([[item], [dict(item, id=2)]]))
+
+    result = get_items_by_year('mr', 2023, fields=['id', 'title', 'author.username', 'assignees.username'])
+    assert result[0] == {
+        'id': 1, 'title': 't', 'author': {'username': 'jdoe'},
+        'assignees': [{'username': 'jdoe'}, {'username': 'ann'}]
+    }
+
+    # 'id' is used for de-duplication but only returned when asked for
+    assert get_items_by_year('mr', 2023, fields=['iid', 'author']) == [
+        {'iid': 7, 'author': item['author']}, {'iid': 7, 'author': item['author']}
+    ]
+
+    with pytest.raises(ValueError):
+        get_items_by_year('mr', 2023, fields='id,title')
+
+
+
+def test_aggregate_items_by_year_groups_and_percentiles():
+    hours = [1, 2, 4, 8, 100]
+    items = [
+        {'id': n, 'project_id': 1 + n % 2, 'state': 'merged', 'author': {'username': 'jdoe'},
+         'created_at': f'2023-0{1 + n % 2}-01T00:00:00Z',
+         'merged_at': (datetime(2023, 1 + n % 2, 1) + timedelta(hours=h)).strftime('%Y-%m-%dT%H:%M:%SZ')}
+        for n, h in enumerate(hours)
+    ] + [{'id': 9, 'project_id': 1, 'state': 'opened', 'author': {'username': 'ann'},
+          'created_at': '2023-01-05T00:00:00Z', 'merged_at': None}]
+    install(get=fake_pages([items]))
+
+    stats = gitlab_calls.aggregate_items_by_year('mr', 2023, group_by=['month', 'state'], percentiles=[50, 100])
+
+    assert stats['total']['count'] == 6
+    merge = stats['total']['time_to_merge']
+    assert merge['count'] == 5
+    assert merge['mean'] == sum(hours) * 3600 / 5
+    assert abs(merge['p50'] - 4 * 3600) <= 0.02 * 4 * 3600
+    assert merge['p100'] == 100 * 3600
+    assert stats['total']['time_to_close'] is None
+    assert [(g['month'], g['state'], g['count']) for g in stats['groups']] == [
+        ('2023-01', 'merged', 3), ('2023-01', 'opened', 1), ('2023-02', 'merged', 2)
+    ]
+
+    with pytest.raises(ValueError):
+        gitlab_calls.aggregate_items_by_year('mr', 2023, group_by=['weekday'])
+    with pytest.raises(ValueError):
+        gitlab_calls.aggregate_items_by_year('mr', 2023, percentiles=[150])
+
+@pytest.fixture
+def item_store(tmp_path):
+    store = gitlab_calls.ItemStore(str(tmp_path / 'items.sqlite3'))
+    gitlab_calls.set_default_store(store)
+    yield store
+    gitlab_calls.set_default_store(None)
+    store.close()
+
+
+def test_item_store_serves_repeat_queries_without_upstream_calls(item_store):
+    items = [dict(item, project_id=1, updated_at=item['created_at']) for item in year_items(250)]
+    requested = []
+    install(get=fake_listing(items, requested=requested))
+
+    first = get_items_by_year('mr', 2023)
+    crawl_requests = len(requested)
+    second = get_items_by_year('mr', 2023)
+
+    assert crawl_requests > 0
+    # the repeat query was answered from the store only
+    assert len(requested) == crawl_requests
+    assert get_items_by_year('mr', 2023, fields=['created_at']) == [{'created_at': item['created_at']} for item in first]
+    assert first == second == get_items_by_year('mr', 2023, use_store=False)
+
+
+def test_item_store_first_query_streams_while_filling(item_store):
+    items = [dict(item, project_id=1, updated_at=item['created_at']) for item in year_items(1000)]
+    requested = []
+    install(get=fake_listing(items, requested=requested))
+
+    async def main():
+        stream = gitlab_calls.iter_items_by_year_async('mr', 2023, pagination='offset')
+        first = await anext(stream)
+        # the first item arrives before the year is crawled, which goes on into the store
+        assert len(requested) < 10 and not item_store.is_loaded('mr', 2023)
+        return [first] + [item async for item in stream]
+
+    streamed = asyncio.run(main())
+    assert len(requested) >= 10 and item_store.is_loaded('mr', 2023)
+    assert streamed == get_items_by_year('mr', 2023)
+
+
+def test_item_store_delta_sync_with_updated_after(item_store):
+    items = [dict(item, project_id=1, updated_at=item['created_at']) for item in year_items(10)]
+    install(get=fake_listing(items))
+    get_items_by_year('issues', 2023)
+
+    delta_params = []
+
+    def fake_get(url, params=None):
+        delta_params.append(params)
+        changed = dict(items[3], title='changed')
+        return MockResponse(json_data=[changed], headers={'x-page': '1', 'x-total-pages': '1'})
+
+    install(get=fake_get)
+    item_store.refresh_interval = 0
+
+    result = get_items_by_year('issues', 2023)
+
+    assert 'updated_after' in delta_params[-1]
+    assert 'created_after' not in delta_params[-1]
+    assert len(result) == 10
+    assert [item for item in result if item['id'] == 3][0]['title'] == 'changed'
+
+
+def test_search_items_uses_indexed_filters(tmp_path):
+    # a store written before the search indexes existed is migrated on open
+    path = str(tmp_path / 'items.sqlite3')
+    legacy = sqlite3.connect(path)
+    legacy.executescript(gitlab_calls.store.SCHEMA)
+    legacy.execute('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?)',
+                   ('mr', 1, 1000, '2022-06-01T00:00:00Z', None,
+                    json.dumps({'id': 1000, 'created_at': '2022-06-01T00:00:00Z', 'state': 'merged',
+                                'author': {'username': 'ann'}, 'labels': ['bug']})))
+    legacy.commit()
+    legacy.close()
+    store = gitlab_calls.ItemStore(path)
+    gitlab_calls.set_default_store(store)
+    try:
+        items = [dict(item, project_id=item['id'] % 3, updated_at=item['created_at'],
+                      state=['opened', 'merged'][item['id'] % 2], author={'username': f"user{item['id'] % 4}"},
+                      assignees=[{'username': 'ann'}] if item['id'] % 5 == 0 else [],
+                      labels=['bug', 'ui'][:item['id'] % 3], milestone={'title': 'v1'} if item['id'] < 50 else None)
+                 for item in year_items(200)]
+        install(get=fake_listing(items))
+
+        found = gitlab_calls.search_items('mr', 2023, state='merged', author='user1', labels=['bug', 'ui'],
+                                          limit=1000)
+        expected = [item for item in items if item['id'] % 2 == 1 and item['id'] % 4 == 1 and item['id'] % 3 == 2]
+        assert found == sorted(expected, key=lambda item: item['created_at'], reverse=True)
+
+        found = gitlab_calls.search_items('mr', 2023, assignee='ann', milestone='v1', project_id=0,
+                                          sort='updated_at', order='asc', fields=['id'])
+        assert found == [{'id': n} for n in range(0, 50, 15)]
+        assert len(gitlab_calls.search_items('mr', 2023, limit=7)) == 7
+
+        # without a year every held item is searched, the migrated one included
+        assert [item['id'] for item in gitlab_calls.search_items('mr', author='ann', labels=['bug'])] == [1000]
+
+        with pytest.raises(ValueError):
+            gitlab_calls.search_items('mr', 2023, reviewer='ann')
+        with pytest.raises(ValueError):
+            gitlab_calls.search_items('mr', 2023, sort='title')
+    finally:
+        gitlab_calls.set_default_store(None)
+        store.close()
+
+
+def test_prefetch_warms_hot_queries_within_budget():
+    store = gitlab_calls.ItemStore(':memory:')
+    gitlab_calls.set_default_store(store)
+    items = {year: [dict(item, project_id=1, updated_at=item['created_at']) for item in year_items(300, year)]
+             for year in (2021, 2022, 2023)}
+
+    def fake_get(url, params=None):
+        year = int(params.get('created_after', '2023')[:4])
+        return fake_listing(items[year])(url, params)
+
+    install(get=fake_get)
+    try:
+        prefetcher = gitlab_calls.Prefetcher(interval=60, top=2, budget=1, warmup='mr:2021')
+        for year in (2022, 2023, 2023, 'x'):
+            prefetcher.record('mr', year)
+        assert prefetcher.hot() == [('mr', 2023), ('mr', 2021)]
+
+        # 2023 loads, 2021 is skipped: the round's budget is spent
+        result = asyncio.run(prefetcher.run_round())
+        assert result['warmed'] == [['mr', 2023]] and result['skipped'] == [['mr', 2021]]
+        assert store.is_loaded('mr', 2023) and not store.is_loaded('mr', 2021)
+
+        # a warmed year is served without upstream calls
+        install(get=lambda url, params=None: pytest.fail("unexpected upstream call"))
+        assert len(get_items_by_year('mr', 2023)) == 300
+
+        with pytest.raises(ValueError):
+            gitlab_calls.Prefetcher(warmup='mr')
+    finally:
+        gitlab_calls.set_default_store(None)
+        store.close()
+
+
+def test_prefetch_needs_a_configured_store():
+    async def main():
+        prefetcher = gitlab_calls.Prefetcher(interval=60)
+        prefetcher.start()
+        assert prefetcher._task is None and not prefetcher.stats()['enabled']
+        with pytest.raises(ValueError):
+            await prefetcher.run_round()
+
+    asyncio.run(main())
+    assert gitlab_calls.get_default_store() is None
+
+
+def test_item_store_required_but_missing():
+    with pytest.raises(ValueError):
+        get_items_by_year('mr', 2023, use_store=True)
+
+
+def test_get_items_invalid_arguments():
+    with pytest.raises(ValueError):
+        get_items_by_year('mr', 1999)
+    with pytest.raises(ValueError):
+        get_items_by_year('commits', 2023)
+    with pytest.raises(ValueError):
+        get_items_by_year('mr', 2023, shard='day')
+    with pytest.raises(ValueError):
+        get_items_by_year('mr', 2023, pagination='cursor')
+
+
+def test_get_items_async_runs_concurrently():
+    install(get=fake_pages([[{'id': 1}]]))
+
+    async def main():
+        return await asyncio.gather(
+            get_items_by_year_async('mr', 2023),
+            get_items_by_year_async('issues', 2024)
+        )
+
+    assert asyncio.run(main()) == [[{'id': 1}], [{'id': 1}]]
+
+
+def test_metrics_account_gitlab_requests():
+    assert gitlab_calls.metrics.endpoint_label(
+        'http://gitlab/api/v4/projects/group%2Fproj/members/7?x=1') == 'projects/:id/members/:id'
+    assert gitlab_calls.metrics.endpoint_label('http://gitlab/api/v4/users') == 'users'
+
+    install(get=fake_pages([[{'id': 1}], [{'id': 2}]]))
+
+    async def main():
+        stats = gitlab_calls.metrics.track_request()
+        await get_items_by_year_async('mr', 2023, pagination='offset')
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats.requests == stats.pages == 2
+    assert stats.bytes == len(b'[{"id":1}]') + len(b'[{"id":2}]')
+
+    # keyset pages followed through the Link header are pages, the single-row probe isn't
+    install(get=fake_keyset_listing(year_items(450), []))
+
+    async def keyset():
+        stats = gitlab_calls.metrics.track_request()
+        await get_items_by_year_async('mr', 2023)
+        return stats
+
+    stats = asyncio.run(keyset())
+    assert stats.requests == 6 and stats.pages == 5
+
+
+def test_jobs_deduplicate_and_resume_failed_windows():
+    items = year_items(600)
+    listing = fake_listing(items)
+    calls = {'failures': 1}
+
+    def flaky_get(url, params=None):
+        # one window fails once, the job is resumed after it
+        if params.get('created_after', '').startswith('2023-03') and calls['failures']:
+            calls['failures'] -= 1
+            return MockResponse(json_data={'message': 'boom'}, status_code=403)
+        return listing(url, params)
+
+    install(get=flaky_get)
+
+    async def main():
+        jobs = gitlab_calls.JobManager(workers=1)
+        job = jobs.submit('issues', 2023, pagination='offset', fields=['created_at'])
+        assert jobs.submit('issues', 2023, pagination='offset', fields=['created_at']) is job
+        with pytest.raises(RuntimeError):
+            [item async for item in job.follow()]
+        assert job.state == 'failed'
+        done_before = len(job.windows_done)
+
+        jobs.resume(job.id)
+        result = [item async for item in job.follow()]
+        await jobs.close()
+        return job, done_before, result
+
+    job, done_before, result = asyncio.run(main())
+    assert job.state == 'done'
+    assert 0 < done_before < 12 and len(job.windows_done) == 12
+    assert sorted(item['created_at'] for item in result) == [item['created_at'] for item in items]
+
+
+def test_jobs_close_while_a_job_is_running():
+    started = []
+
+    async def slow_handler(request: httpx.Request):
+        started.append(request)
+        await asyncio.sleep(60)
+
+    gitlab_calls.set_transport(httpx.MockTransport(slow_handler))
+
+    async def main():
+        jobs = gitlab_calls.JobManager(workers=1)
+        job = jobs.submit('issues', 2023, pagination='offset')
+        while not started:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(jobs.close(), 3)
+        return job
+
+    assert asyncio.run(main()).state == 'cancelled'
+
+
+def test_get_items_page_walks_the_year_with_cursors():
+    items = year_items(250)
+    # several items in the same second across a page boundary
+    items += [{'id': 1000 + n, 'created_at': items[170]['created_at']} for n in range(3)]
+    requested = []
+    install(get=fake_listing(items, requested=requested))
+
+    page = gitlab_calls.get_items_page('mr', 2023, limit=40)
+    assert len(requested) == 1 and len(page['items']) == 40
+
+    collected = page['items']
+    while page['next_cursor']:
+        page = gitlab_calls.get_items_page('mr', 2023, limit=40, cursor=page['next_cursor'], fields=['id'])
+        collected += page['items']
+    assert sorted(item['id'] for item in collected) == sorted(item['id'] for item in items)
+
+    with pytest.raises(ValueError):
+        gitlab_calls.get_items_page('issues', 2023, cursor=gitlab_calls.get_items_page('mr', 2023, limit=1)['next_cursor'])
+    with pytest.raises(ValueError):
+        gitlab_calls.get_items_page('mr', 2023, cursor='garbage')
+
+
+def test_get_items_page_with_store_pages_gitlab_until_loaded(item_store):
+    items = [dict(item, project_id=1, updated_at=item['created_at']) for item in year_items(1000)]
+    requested = []
+    install(get=fake_listing(items, requested=requested))
+
+    # the first screen of a year not in the store costs one upstream page
+    page = gitlab_calls.get_items_page('mr', 2023, limit=10)
+    assert len(requested) == 1 and not item_store.is_loaded('mr', 2023)
+
+    gitlab_calls.sync_store('mr', 2023)
+    crawled = len(requested)
+    assert gitlab_calls.get_items_page('mr', 2023, limit=10) == page
+    assert len(requested) == crawled
+
+
+def test_export_items_csv_and_parquet(tmp_path):
+    import csv
+    items = [
+        {'id': n, 'iid': n, 'project_id': 3, 'title': f't{n}', 'state': 'merged',
+         'author': {'id': 9, 'username': 'jdoe'}, 'assignees': [{'username': 'ann'}, {'username': 'bob'}],
+         'labels': ['bug'], 'created_at': f'2023-01-0{n}T10:00:00.000Z', 'merged_at': f'2023-01-0{n}T12:00:00Z',
+         'description': 'dropped'}
+        for n in range(1, 6)
+    ]
+    install(get=fake_pages([items[:3], items[3:]]))
+
+    gitlab_calls.export_items_by_year('mr', 2023, tmp_path / 'mr.csv', format='csv', batch_rows=2)
+    with open(tmp_path / 'mr.csv', newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert [row['id'] for row in rows] == ['1', '2', '3', '4', '5']
+    assert rows[0]['assignee_usernames'] == 'ann;bob'
+    assert rows[0]['author_username'] == 'jdoe'
+    assert 'description' not in rows[0]
+
+    pq = pytest.importorskip('pyarrow.parquet')
+    gitlab_calls.export_items_by_year('mr', 2023, tmp_path / 'mr.parquet', format='parquet', batch_rows=2)
+    table = pq.read_table(tmp_path / 'mr.parquet')
+    assert table.num_rows == 5
+    assert table.column('labels').to_pylist()[0] == ['bug']
+    assert str(table.schema.field('created_at').type) == 'timestamp[ms, tz=UTC]'
+
+    with pytest.raises(ValueError):
+        gitlab_calls.export_items_by_year('mr', 2023, tmp_path / 'mr.xml', format='xml')
+
+
+def test_reconcile_memberships_writes_only_differences():
+    members = {'g/a': [{'id': 1, 'username': 'user1', 'access_level': 30},
+                       {'id': 2, 'username': 'user2', 'access_level': 20}],
+               'g': [{'id': 1, 'username': 'user1', 'access_level': 10}]}
+    ids = {'g%2Fa': 'g/a', 'g': 'g'}
+    writes = []
+
+    def fake_get(url, params=None):
+        if url.endswith('/members'):
+            target = {'100': 'g/a', '101': 'g'}[url.split('/')[-2]]
+            return MockResponse(json_data=members[target], headers={'x-page': '1', 'x-total-pages': '1'})
+        if '/api/v4/users' in url:
+            return MockResponse(json_data=[{'id': int(params['username'][-1])}])
+        return MockResponse(json_data={'id': 100 + list(ids).index(url.split('/')[-1])})
+
+    def fake_put(url, json=None):
+        writes.append(('PUT', url, json))
+        return MockResponse(json_data=json)
+
+    def fake_post(url, json=None):
+        writes.append(('POST', url, json))
+        return MockResponse(json_data=json, status_code=201)
+
+    install(get=fake_get, put=fake_put, post=fake_post)
+    manifest = [
+        {'username': 'user1', 'repo_or_group': 'g/a', 'role': 'developer'},     # unchanged
+        {'username': 'user2', 'repo_or_group': 'g/a', 'role': 'maintainer'},    # update
+        {'username': 'user3', 'repo_or_group': 'g/a', 'role': 'guest'},         # add
+        {'username': 'user1', 'repo_or_group': 'g', 'role': 'guest'},           # unchanged
+        {'username': 'user1', 'repo_or_group': 'g', 'role': 'boss'},
+        {'username': 'user1', 'repo_or_group': {'id': 101}, 'role': 'guest'},
+    ]
+
+    plan = gitlab_calls.reconcile_memberships(manifest, dry_run=True)
+    assert writes == []
+    assert (plan['added'], plan['updated'], plan['unchanged'], plan['failed']) == (1, 1, 2, 2)
+    assert "must be strings" in plan['changes'][1]['error']
+
+    result = gitlab_calls.reconcile_memberships(manifest)
+    assert sorted((method, url.split('/api/v4/')[1], json['access_level']) for method, url, json in writes) == [
+        ('POST', 'projects/100/members', 10), ('PUT', 'projects/100/members/2', 40)
+    ]
+    assert [(change['username'], change['action']) for change in result['changes'] if change['success']] == [
+        ('user2', 'update'), ('user3', 'add')
+    ]
+
+
+def test_grant_group_projects_fans_out_over_the_hierarchy():
+    projects = [{'id': n, 'path_with_namespace': f'g/sub{n % 3}/p{n}'} for n in range(1, 251)]
+    listing = fake_pages([projects[i:i + 100] for i in range(0, 250, 100)], totals=True)
+    calls = {'users': 0, 'groups': 0, 'projects': []}
+    in_flight = peak = 0
+
+    def fake_get(url, params=None):
+        if url.endswith('/projects'):
+            calls['projects'].append(params)
+            return listing(url, params)
+        key = 'users' if '/users' in url else 'groups'
+        calls[key] += 1
+        return MockResponse(json_data=[{'id': 5}] if key == 'users' else {'id': 77})
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        if request.method == 'GET':
+            return fake_get(str(request.url.copy_with(query=None)), dict(request.url.params))
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        project_id = int(request.url.path.split('/')[4])
+        if project_id % 50 == 0:
+            return MockResponse(json_data={'message': 'Forbidden'}, status_code=403)
+        return MockResponse(json_data={'access_level': 20})
+
+    gitlab_calls.set_transport(httpx.MockTransport(handler))
+
+    result = gitlab_calls.grant_group_projects('jdoe', 'g', 'reporter', concurrency=6)
+
+    assert calls['users'] == 1 and calls['groups'] == 1
+    assert calls['projects'][0]['include_subgroups'] == 'true'
+    assert sorted(r['project_id'] for r in result['results']) == list(range(1, 251))
+    assert result['failed'] == 5
+    assert result['results'][-1]['done'] == 250 and result['results'][-1]['total'] == 250
+    assert peak <= 6
+
+
+def test_webhook_events_upsert_into_the_store():
+    store = gitlab_calls.ItemStore(':memory:')
+    payload = {
+        'object_kind': 'merge_request',
+        'user': {'id': 9, 'username': 'jdoe', 'name': 'J'},
+        'object_attributes': {
+            'id': 42, 'iid': 7, 'target_project_id': 3, 'title': 'Fix', 'state': 'opened', 'author_id': 9,
+            'created_at': '2023-05-01 10:00:00 UTC', 'updated_at': '2023-05-02 10:00:00 UTC',
+            'source_branch': 'fix', 'target_branch': 'main', 'url': 'http://gitlab/mr/7'
+        },
+        'labels': [{'title': 'bug'}],
+        'assignees': [{'id': 8, 'username': 'ann', 'name': 'A'}],
+    }
+
+    item_type, item = gitlab_calls.ingest_event('Merge Request Hook', payload, store)
+    assert item_type == 'mr'
+    assert item['created_at'] == '2023-05-01T10:00:00.000Z'
+    assert item['author'] == {'id': 9, 'username': 'jdoe', 'name': 'J'}
+    assert store.items_page('mr', 2023) == [item]
+
+    # an older delivery arriving late doesn't overwrite the stored item
+    newer = dict(payload, object_attributes=dict(payload['object_attributes'], state='merged',
+                                                 updated_at='2023-05-03T10:00:00Z'))
+    gitlab_calls.ingest_event('Merge Request Hook', newer, store)
+    gitlab_calls.ingest_event('Merge Request Hook', payload, store)
+    assert store.items_page('mr', 2023)[0]['state'] == 'merged'
+
+    assert gitlab_calls.ingest_event('Push Hook', {}, store) is None
+    with pytest.raises(ValueError):
+        gitlab_calls.ingest_event('Issue Hook', {'object_kind': 'issue'}, store)
+
+    # a hook sent by someone else updates a crawled item without losing what it lacks
+    crawled = {'id': 43, 'iid': 8, 'project_id': 3, 'title': 'Old', 'state': 'opened',
+               'created_at': '2023-06-01T10:00:00.000Z', 'updated_at': '2023-06-01T10:00:00.000Z',
+               'author': {'id': 9, 'username': 'alice', 'name': 'Alice'}, 'milestone': {'id': 5, 'title': 'v1'},
+               'labels': ['bug'], 'references': {'full': 'group/project!8'}}
+    store.upsert('mr', [crawled])
+    update = dict(payload, user={'id': 10, 'username': 'bob'}, object_attributes=dict(
+        payload['object_attributes'], id=43, iid=8, title='New', author_id=9, milestone_id=5,
+        created_at='2023-06-01 10:00:00 UTC', updated_at='2023-06-02 10:00:00 UTC'))
+    _, item = gitlab_calls.ingest_event('Merge Request Hook', update, store)
+    assert item['title'] == 'New' and item['references'] == crawled['references']
+    assert item['author'] == crawled['author'] and item['milestone'] == crawled['milestone']
+    assert [found['id'] for found in store.search('mr', author='alice', milestone='v1')] == [43]
+    assert store.search('mr', author='alice')[0]['title'] == 'New'
+
+    assert gitlab_calls.verify_token('s3cret', secret='s3cret')
+    assert not gitlab_calls.verify_token('wrong', secret='s3cret')
+    assert not gitlab_calls.verify_token(None, secret='s3cret')
+    assert not gitlab_calls.verify_token('', secret='')
+
+    # without a configured store the event is refused, no in-memory default is made
+    with pytest.raises(ValueError):
+        gitlab_calls.ingest_event('Merge Request Hook', payload)
+    assert gitlab_calls.get_default_store() is None